@@ -0,0 +1,389 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+# drives ingestion, chat turns and retrieval against the fake backends in fakes.py, on a throwaway
+# data directory, and reports throughput, latency percentiles and memory for each scenario.
+#
+#   python -m benchmark --sessions 4 --turns 100 --concurrency 8 --llm-latency 0.2
+
+SCENARIOS = ("ingest", "chat", "retrieval")
+BENCH_SEED = 7
+VOCABULARY_SIZE = 2000
+PARAGRAPH_WORDS = 120
+JOB_POLL_INTERVAL = 0.01
+INGEST_TIMEOUT = 600
+SYLLABLES = ("ka", "lo", "mer", "tin", "sa", "vel", "dor", "pi", "ran", "qua", "zel", "mo", "tes", "ni", "gor", "bra")
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+def make_vocabulary(rng, size=VOCABULARY_SIZE):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 5))))
+    return sorted(words)
+
+
+def make_page(rng, vocabulary, words):
+    # zipf-like weights, so a few words dominate each page like real topics do
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    text = rng.choices(vocabulary, weights=weights, k=words)
+    paragraphs = [" ".join(text[i:i + PARAGRAPH_WORDS]) for i in range(0, len(text), PARAGRAPH_WORDS)]
+    body = "".join(f"<p>{paragraph}.</p>" for paragraph in paragraphs)
+    return f"<html><head><title>{text[0]}</title></head><body>{body}</body></html>".encode("utf-8")
+
+
+class CorpusServer:
+    # serves the generated pages over real http, so fetching and parsing stay in the measurement
+    def __init__(self, pages):
+        pages_by_path = pages
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                page = pages_by_path.get(self.path)
+                if page is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_port}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def build_services(workdir, options):
+    from database.client import DatabaseClient
+    from fakes import FakeChatModel, FakeEmbeddings, FakeLLM, FakeSearchTool
+    from http_client import HttpClient, ResponseCache
+    from llm import FAKE_EMBEDDING_MODEL
+    from source_cache import SourceCache
+    from vectorstore.cache import CachedEmbeddings, EmbeddingCache
+    from vectorstore.client import VectoreStoreClient
+    from services.chats import ChatService
+    from services.docs import DocsService
+    from services.history import HistoryService
+    from services.jobs import JobService
+    from services.messages import MessageService
+    from services.mindmaps import MindmapService
+    from services.sessions import SessionService
+    from services.sources import SourceService
+
+    # fresh instances wired to each other, nothing touches the real data directory or the singletons
+    db = DatabaseClient(db_path=workdir / "database.db")
+    chat_llm = FakeChatModel(latency=options.llm_latency, tool_calls_per_step=options.tool_calls)
+
+    vectorstore = VectoreStoreClient()
+    vectorstore.vectorstore_path = workdir / "chroma"
+    vectorstore.embeddings = CachedEmbeddings(
+        FakeEmbeddings(latency=options.embedding_latency),
+        model=FAKE_EMBEDDING_MODEL,
+        cache=EmbeddingCache(path=workdir / "embeddings.db"),
+    )
+
+    docs = DocsService()
+    docs.db_client = db
+    docs.vectorstore_client = vectorstore
+    docs.http_client = HttpClient(cache=ResponseCache(path=workdir / "http_cache.db"))
+    docs.source_cache = SourceCache(path=workdir / "sources.db")
+
+    mindmaps = MindmapService()
+    mindmaps.db_client = db
+
+    sources = SourceService()
+    sources.db_client = db
+    sources.docs_service = docs
+
+    jobs = JobService()
+    jobs.db_client = db
+
+    sessions = SessionService()
+    sessions.db_client = db
+    sessions.docs_service = docs
+    sessions.source_service = sources
+    sessions.job_service = jobs
+    sessions.mindmap_service = mindmaps
+    sessions.llm = FakeLLM(latency=options.llm_latency)
+
+    history = HistoryService(llm=chat_llm)
+    history.db_client = db
+
+    messages = MessageService()
+    messages.db_client = db
+    messages.docs_service = docs
+    messages.mindmap_service = mindmaps
+    messages.history_service = history
+    messages.llm = chat_llm
+    messages.web_search_tool = FakeSearchTool(latency=options.search_latency)
+
+    chats = ChatService()
+    chats.db_client = db
+    chats.docs_service = docs
+    chats.message_service = messages
+
+    return SimpleNamespace(
+        db=db, docs=docs, mindmaps=mindmaps, sources=sources, jobs=jobs,
+        sessions=sessions, history=history, messages=messages, chats=chats,
+    )
+
+
+def close_services(services):
+    services.jobs.shutdown()
+    services.history.executor.shutdown(wait=True)
+    services.db.close()
+
+
+def rss_peak_mb():
+    # ru_maxrss is the high-water mark of the whole process, in KiB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+
+
+def measure(name, operations, concurrency, trace_memory=False, is_async=False):
+    # async operations return a coroutine and run as tasks on one event loop, like requests in the api
+    from metrics import stage_seconds
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def timed(operation):
+        start = time.perf_counter()
+        try:
+            operation()
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    async def atimed(operation, semaphore):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await operation()
+            except Exception as e:
+                errors.append(repr(e))
+                return
+            latencies.append(time.perf_counter() - start)
+
+    async def run_tasks():
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(atimed(operation, semaphore) for operation in operations))
+
+    stages_before = stage_seconds.totals()
+    rss_before = rss_peak_mb()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if is_async:
+        asyncio.run(run_tasks())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"bench-{name}") as executor:
+            list(executor.map(timed, operations))
+    wall = time.perf_counter() - start
+    rss_after = rss_peak_mb()
+    heap_peak = None
+    if trace_memory:
+        heap_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    stages = {}
+    for (stage,), (count, total) in stage_seconds.totals().items():
+        count_before, total_before = stages_before.get((stage,), (0, 0.0))
+        if count > count_before:
+            stages[stage] = {"count": count - count_before, "mean_ms": (total - total_before) / (count - count_before) * 1000}
+
+    return {
+        "scenario": name,
+        "ops": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "wall_s": wall,
+        "ops_per_s": len(latencies) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        # the process peak includes earlier scenarios, the growth is what this one added on top
+        "process_rss_peak_mb": rss_after,
+        "rss_peak_growth_mb": rss_after - rss_before if resource else None,
+        "heap_peak_mb": heap_peak,
+        "stages": stages,
+    }
+
+
+def run_ingest(services, server, options):
+    from routes.sessions import Source
+
+    def ingest(sources):
+        def operation():
+            session_id, job_id = services.sessions.create_new_session(sources)
+            deadline = time.monotonic() + INGEST_TIMEOUT
+            while time.monotonic() < deadline:
+                job = services.jobs.get_job(job_id)
+                if job["status"] == "completed":
+                    session_ids.append(session_id)
+                    return
+                if job["status"] in ("failed", "cancelled"):
+                    raise RuntimeError(f"session {session_id} {job['status']}: {job['error']}")
+                time.sleep(JOB_POLL_INTERVAL)
+            raise TimeoutError(f"session {session_id} did not finish ingesting")
+        return operation
+
+    session_ids = []
+    operations = [
+        ingest([Source(url=server.url(f"/s{session}/p{page}"), type="web_page") for page in range(options.sources)])
+        for session in range(options.sessions)
+    ]
+    return measure("ingest", operations, options.concurrency, options.trace_memory), session_ids
+
+
+def run_chat(services, session_ids, options):
+    from utils import index_mindmap_nodes
+
+    chats = []
+    for session_id in session_ids:
+        nodes = index_mindmap_nodes(services.mindmaps.get_mindmap(session_id)).values()
+        for node in nodes:
+            for chat_type in options.chat_types:
+                chat = services.chats.create_new_chat(session_id, node["node_id"], chat_type)
+                chats.append((chat["id"], node["title"]))
+    if not chats:
+        raise RuntimeError("no chats to drive, ingestion produced no mindmap")
+
+    # the same async path the /messages route awaits
+    operations = []
+    for turn in range(options.turns):
+        chat_id, title = chats[turn % len(chats)]
+        operations.append(lambda chat_id=chat_id, content=f"Explain {title} with an example ({turn})":
+                          services.messages.acreate_new_message(chat_id, content))
+    return measure("chat", operations, options.concurrency, options.trace_memory, is_async=True)
+
+
+def run_retrieval(services, session_ids, vocabulary, options):
+    rng = random.Random(BENCH_SEED + 1)
+    # a quarter of the queries repeat, like users reopening the same nodes
+    pool = [" ".join(rng.choices(vocabulary[:200], k=3)) for _ in range(max(1, options.queries * 3 // 4))]
+    operations = []
+    for _ in range(options.queries):
+        query, session_id = rng.choice(pool), rng.choice(session_ids)
+        operations.append(lambda query=query, session_id=session_id: services.docs.aquery_all_docs(query, session_id))
+    return measure("retrieval", operations, options.concurrency, options.trace_memory, is_async=True)
+
+
+def run_benchmark(options):
+    rng = random.Random(BENCH_SEED)
+    vocabulary = make_vocabulary(rng)
+    pages = {
+        f"/s{session}/p{page}": make_page(rng, vocabulary, options.words)
+        for session in range(options.sessions)
+        for page in range(options.sources)
+    }
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="synaptiq-bench-", ignore_cleanup_errors=True) as tmp:
+        workdir = Path(options.workdir or tmp)
+        workdir.mkdir(parents=True, exist_ok=True)
+        services = build_services(workdir, options)
+        try:
+            with CorpusServer(pages) as server:
+                # later scenarios need ingested sessions, so ingestion always runs
+                result, session_ids = run_ingest(services, server, options)
+                results.append(result)
+            if "chat" in options.scenarios and session_ids:
+                results.append(run_chat(services, session_ids, options))
+            if "retrieval" in options.scenarios and session_ids:
+                results.append(run_retrieval(services, session_ids, vocabulary, options))
+        finally:
+            close_services(services)
+    return results
+
+
+def format_results(results):
+    # rss is the peak of the whole process so far, +rss is how much this scenario raised it
+    header = (f"{'scenario':<10} {'ops':>6} {'errors':>6} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} "
+              f"{'rss MB':>8} {'+rss MB':>8} {'heap MB':>8}")
+    lines = [header, "-" * len(header)]
+    for result in results:
+        rss = f"{result['process_rss_peak_mb']:.0f}" if result["process_rss_peak_mb"] is not None else "-"
+        growth = f"{result['rss_peak_growth_mb']:.0f}" if result["rss_peak_growth_mb"] is not None else "-"
+        heap = f"{result['heap_peak_mb']:.1f}" if result["heap_peak_mb"] is not None else "-"
+        lines.append(
+            f"{result['scenario']:<10} {result['ops']:>6} {result['errors']:>6} {result['ops_per_s']:>9.2f} "
+            f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} {rss:>8} {growth:>8} {heap:>8}"
+        )
+    for result in results:
+        if result["first_error"]:
+            lines.append(f"{result['scenario']} first error: {result['first_error']}")
+        slowest = sorted(result["stages"].items(), key=lambda item: -item[1]["count"] * item[1]["mean_ms"])[:6]
+        stages = ", ".join(f"{stage} {stats['mean_ms']:.1f}ms x{stats['count']}" for stage, stats in slowest)
+        lines.append(f"{result['scenario']} stages: {stages}")
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of ingestion, chat turns and retrieval on fake backends")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--sessions", type=int, default=4, help="sessions to ingest")
+    parser.add_argument("--sources", type=int, default=3, help="web pages per session")
+    parser.add_argument("--words", type=int, default=3000, help="words per page")
+    parser.add_argument("--turns", type=int, default=100, help="chat messages to send")
+    parser.add_argument("--chat-types", nargs="+", choices=("normal", "deepdive"), default=["normal", "deepdive"])
+    parser.add_argument("--tool-calls", type=int, default=2, help="searches the fake model asks for per deepdive turn")
+    parser.add_argument("--queries", type=int, default=500, help="retrieval queries to run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake llm call")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="seconds per fake embedding call")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="seconds per fake web search")
+    parser.add_argument("--trace-memory", action="store_true", help="report peak python heap per scenario, slows everything down")
+    parser.add_argument("--workdir", help="keep the data here instead of a temporary directory")
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    results = run_benchmark(options)
+    print(format_results(results))
+    if options.json:
+        Path(options.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from database.client import ConnectionPool
+
+CACHE_POOL_SIZE = 4
+CACHE_EVICT_TARGET = 0.9  # share of max_bytes left once an eviction is done
+
+
+class SqliteCache:
+    # one size-bounded sqlite table, subclasses provide the schema and how entries are (de)serialised.
+    # every row has a size and a last_used column, total_bytes tracks the sum of sizes
+    table = None
+    key_columns = ()
+    schema = ""
+    # least recently used first, :now is bound to the current time
+    evict_order = "last_used ASC"
+
+    def __init__(self, path, max_bytes, pool_size=CACHE_POOL_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+
+        self.pool = ConnectionPool(self.path, size=pool_size)
+        self._lock = threading.Lock()
+        with self.connection() as conn:
+            conn.executescript(self.schema)
+            self.total_bytes = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+    @contextmanager
+    def connection(self):
+        conn = self.pool.acquire()
+        try:
+            yield conn
+        finally:
+            self.pool.release(conn)
+
+    def _put_rows(self, rows, replace=True):
+        # rows are dicts of column values including size, an existing entry is replaced or kept
+        if not rows:
+            return
+        columns = list(rows[0])
+        verb = "REPLACE" if replace else "IGNORE"
+        insert = f"INSERT OR {verb} INTO {self.table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        with self._lock, self.connection() as conn:
+            for row in rows:
+                previous = conn.execute(
+                    f"SELECT size FROM {self.table} WHERE {self._key_filter()}", [row[column] for column in self.key_columns]
+                ).fetchone()
+                if previous and not replace:
+                    continue
+                conn.execute(insert, [row[column] for column in columns])
+                self.total_bytes += row["size"] - (previous["size"] if previous else 0)
+            conn.commit()
+            if self.total_bytes > self.max_bytes:
+                self._evict(conn)
+
+    def _delete_row(self, key, size):
+        # same order as _put_rows, the lock first and then a connection
+        with self._lock, self.connection() as conn:
+            cursor = conn.execute(f"DELETE FROM {self.table} WHERE {self._key_filter()}", key)
+            conn.commit()
+            if cursor.rowcount:
+                self.total_bytes -= size
+
+    def _evict(self, conn):
+        target = int(self.max_bytes * CACHE_EVICT_TARGET)
+        rows = conn.execute(
+            f"SELECT {', '.join(self.key_columns)}, size FROM {self.table} ORDER BY {self.evict_order}", {"now": time.time()}
+        ).fetchall()
+        evicted = []
+        for row in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append(tuple(row[column] for column in self.key_columns))
+            self.total_bytes -= row["size"]
+        conn.executemany(f"DELETE FROM {self.table} WHERE {self._key_filter()}", evicted)
+        conn.commit()
+
+    def _key_filter(self):
+        return " AND ".join(f"{column} = ?" for column in self.key_columns)
+
+    def close(self):
+        self.pool.close()
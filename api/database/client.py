@@ -1,36 +1,182 @@
 import sqlite3
+import threading
+from queue import Queue, Empty
 from pathlib import Path
 from contextlib import contextmanager
+from metrics import span
 
 SQLITE_DB_PATH = Path(__file__).parent / ".sqlite" / "database.db"
+SCHEMA_PATH = Path(__file__).parent / "schemas.sql"
+MIGRATIONS_PATH = Path(__file__).parent / "migrations"
+SQLITE_POOL_SIZE = 8
+SQLITE_POOL_TIMEOUT = 30  # seconds, a thread that already holds a connection and asks for another would otherwise wait forever
+SQLITE_CACHED_STATEMENTS = 256
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "busy_timeout": 5000,
+    "cache_size": -64000,  # negative means KiB, so ~64MB
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+class ConnectionPool:
+    def __init__(self, db_path, size=SQLITE_POOL_SIZE, pragmas=SQLITE_PRAGMAS):
+        self.db_path = db_path
+        self.size = size
+        self.pragmas = pragmas
+        self._pool = Queue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        # connections are handed across threadpool workers, but only ever used by one at a time
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            cached_statements=SQLITE_CACHED_STATEMENTS,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def acquire(self, timeout=SQLITE_POOL_TIMEOUT):
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        try:
+            return self._pool.get_nowait()
+        except Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        try:
+            return self._pool.get(timeout=timeout)
+        except Empty:
+            raise TimeoutError(f"No free connection to {self.db_path} after {timeout}s, all {self.size} are in use") from None
+
+    def release(self, conn):
+        # never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._pool.put_nowait(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except Empty:
+                break
 
 class DatabaseClient:
-    def __init__(self):
-        self.db_path = SQLITE_DB_PATH
+    def __init__(self, db_path=SQLITE_DB_PATH, pool_size=SQLITE_POOL_SIZE):
+        self.db_path = db_path
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
-       
-        self.conn = sqlite3.connect(self.db_path)
-        self.cursor = self.conn.cursor()
-        self.init_database()
+
+        self.pool = ConnectionPool(self.db_path, size=pool_size)
+        # the schema is applied on first use (or by the app lifespan), never at import
+        self._initialized = False
+        self._init_lock = threading.Lock()
         
     @contextmanager
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  
-        conn.execute("PRAGMA foreign_keys = ON") 
+        if not self._initialized:
+            self.init_database()
+        # the pool wait and the statements are timed apart, only sqlite errors count against the queries
+        with span("db.acquire"):
+            conn = self.pool.acquire()
         try:
-            yield conn
+            with span("db.query", errors=sqlite3.Error):
+                yield conn
         finally:
-            conn.close()
+            self.pool.release(conn)
+
+    def close(self):
+        self.pool.close()
+
+    def _keyset(self, query, params, limit, before_id):
+        if before_id is not None:
+            query += (" AND" if " WHERE " in query else " WHERE") + " id < ?"
+            params = [*params, before_id]
+        query += " ORDER BY id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params = [*params, limit]
+        return query, params
             
     def init_database(self):
-        schema_path = Path(__file__).parent / "schemas.sql"
-        with open(schema_path, 'r') as f:
-            schema_sql = f.read()
-        
+        with self._init_lock:
+            if self._initialized:
+                return
+            with open(SCHEMA_PATH, 'r') as f:
+                schema_sql = f.read()
+
+            conn = self.pool.acquire()
+            try:
+                conn.executescript(schema_sql)
+                conn.commit()
+                self._migrate(conn)
+            finally:
+                self.pool.release(conn)
+            self._initialized = True
+
+    def migrate(self):
         with self.get_connection() as conn:
-            conn.executescript(schema_sql)
+            self._migrate(conn)
+
+    def _migrate(self, conn):
+        # schemas.sql is the baseline, numbered files in migrations/ move existing databases forward
+        # and PRAGMA user_version records the last one applied
+        # take the write lock before reading the version so concurrent workers cannot apply twice
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            for version, path in self.get_migrations():
+                if version <= current:
+                    continue
+                for statement in self._split_statements(path.read_text()):
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version}")
             conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def get_schema_version(self):
+        with self.get_connection() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def get_migrations(self):
+        migrations = []
+        for path in sorted(MIGRATIONS_PATH.glob("*.sql")):
+            version = int(path.name.split("_", 1)[0])
+            migrations.append((version, path))
+        return migrations
+
+    def _split_statements(self, sql):
+        statements, statement = [], ""
+        for line in sql.splitlines(keepends=True):
+            statement += line
+            if sqlite3.complete_statement(statement):
+                statements.append(statement.strip())
+                statement = ""
+        if statement.strip() and not all(line.strip().startswith("--") or not line.strip() for line in statement.splitlines()):
+            raise ValueError(f"Incomplete SQL statement in migration: {statement.strip()}")
+        return statements
             
     def insert_session(self):
         with self.get_connection() as conn:
@@ -49,11 +195,18 @@ class DatabaseClient:
             session = cursor.fetchone()
             return dict(session) if session else None
             
-    def get_sessions(self):
+    def get_sessions(self, limit=None, before_id=None):
+        # ids grow with created_at, so they double as a stable keyset cursor
+        query, params = self._keyset("SELECT * FROM sessions", [], limit, before_id)
         with self.get_connection() as conn:
-            cursor = conn.execute("SELECT * FROM sessions ORDER BY created_at DESC")
+            cursor = conn.execute(query, params)
             return [dict(row) for row in cursor.fetchall()]
         
+    def get_session_ids(self):
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT id FROM sessions")
+            return {row["id"] for row in cursor.fetchall()}
+
     def delete_session(self, session_id):
         with self.get_connection() as conn:
             conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
@@ -61,7 +214,10 @@ class DatabaseClient:
         
     def insert_mindmap(self, session_id, mindmap):
         with self.get_connection() as conn:
-            conn.execute("INSERT INTO mindmaps (session_id, mindmap_json) VALUES (?, ?)", (session_id, mindmap))
+            conn.execute(
+                """INSERT INTO mindmaps (session_id, mindmap_json) VALUES (?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET mindmap_json = excluded.mindmap_json, created_at = CURRENT_TIMESTAMP""",
+                (session_id, mindmap))
             conn.commit()
             
     def get_mindmap(self, session_id):
@@ -97,6 +253,7 @@ class DatabaseClient:
     def delete_chat(self, chat_id):
         with self.get_connection() as conn:
             conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+            conn.commit()
             
     def insert_source(self, source_title, source_type, url, session_id):
         with self.get_connection() as conn:
@@ -108,18 +265,62 @@ class DatabaseClient:
         with self.get_connection() as conn:
             cursor = conn.execute("SELECT * FROM sources WHERE session_id = ?", (session_id,))
             return [dict(row) for row in cursor.fetchall()]
+
+    def get_source_ids(self):
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT id FROM sources")
+            return {row["id"] for row in cursor.fetchall()}
+
+    def delete_source(self, source_id):
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM sources WHERE id = ?", (source_id,))
+            conn.commit()
+
+    def delete_sources(self, session_id):
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM sources WHERE session_id = ?", (session_id,))
+            conn.commit()
         
+    def insert_chunks(self, session_id, chunks):
+        # chunk ids are deterministic, a retried batch leaves the existing rows alone
+        with self.get_connection() as conn:
+            conn.executemany(
+                "INSERT INTO chunks (chunk_id, session_id, source_id, content, metadata) VALUES (?, ?, ?, ?, ?) ON CONFLICT(chunk_id) DO NOTHING",
+                [(chunk_id, session_id, source_id, content, metadata) for chunk_id, source_id, content, metadata in chunks])
+            conn.commit()
+
+    def search_chunks(self, session_id, match, limit):
+        # the session token narrows the match before bm25 scores anything, the session column carries no weight
+        match = f'session_id : "{int(session_id)}" AND content : ({match})'
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                """SELECT chunks.*, bm25(chunks_fts, 1.0, 0.0) AS score FROM chunks_fts
+                JOIN chunks ON chunks.id = chunks_fts.rowid
+                WHERE chunks_fts MATCH ?
+                ORDER BY score LIMIT ?""",
+                (match, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
     def insert_file(self, filename, original_filename, content_type, size):
         with self.get_connection() as conn:
-            cursor = conn.execute("INSERT INTO files (filename, original_filename, content_type, size) VALUES (?, ?, ?, ?)", (filename, original_filename, content_type, size))
+            # filenames are content hashes, a concurrent upload of the same bytes keeps the first row
+            conn.execute("INSERT INTO files (filename, original_filename, content_type, size) VALUES (?, ?, ?, ?) ON CONFLICT (filename) DO NOTHING", (filename, original_filename, content_type, size))
             conn.commit()
-            return cursor.lastrowid
+            cursor = conn.execute("SELECT id FROM files WHERE filename = ?", (filename,))
+            return cursor.fetchone()["id"]
     
-    def get_all_files(self):
+    def get_all_files(self, limit=None, before_id=None):
+        query, params = self._keyset("SELECT * FROM files", [], limit, before_id)
         with self.get_connection() as conn:
-            cursor = conn.execute("SELECT * FROM files ORDER BY created_at DESC")
+            cursor = conn.execute(query, params)
             return [dict(row) for row in cursor.fetchall()]
         
+    def get_file_by_filename(self, filename):
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT * FROM files WHERE filename = ?", (filename,))
+            file = cursor.fetchone()
+            return dict(file) if file else None
+
     def get_files(self, session_id):    
         with self.get_connection() as conn:
             cursor = conn.execute("SELECT * FROM files WHERE session_id = ?", (session_id,))
@@ -137,15 +338,77 @@ class DatabaseClient:
             conn.commit()
             return dict(message) if message else None
         
-    def get_messages(self, chat_id, desc = True):
+    def get_messages(self, chat_id, desc = True, limit = None, before_id = None):
+        if limit is None and before_id is None:
+            with self.get_connection() as conn:
+                cursor = conn.execute(f"SELECT * FROM messages WHERE chat_id = ? ORDER BY id {'DESC' if desc else 'ASC'}", (chat_id,))
+                return [dict(row) for row in cursor.fetchall()]
+
+        # a page is always the newest messages before the cursor, flipped back when asked for ascending order
+        query, params = self._keyset("SELECT * FROM messages WHERE chat_id = ?", [chat_id], limit, before_id)
         with self.get_connection() as conn:
-            cursor = conn.execute(f"SELECT * FROM messages WHERE chat_id = ? ORDER BY id {'DESC' if desc else 'ASC'}", (chat_id,))
-            return [dict(row) for row in cursor.fetchall()]
+            rows = [dict(row) for row in conn.execute(query, params).fetchall()]
+            return rows if desc else rows[::-1]
         
+    def get_recent_messages(self, chat_id, after_id=0, limit=50):
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT * FROM messages WHERE chat_id = ? AND id > ? ORDER BY id DESC LIMIT ?", (chat_id, after_id, limit))
+            return [dict(row) for row in reversed(cursor.fetchall())]
+
+    def get_messages_between(self, chat_id, after_id, before_id):
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT * FROM messages WHERE chat_id = ? AND id > ? AND id < ? ORDER BY id ASC", (chat_id, after_id, before_id))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_chat_summary(self, chat_id):
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT * FROM chat_summaries WHERE chat_id = ?", (chat_id,))
+            summary = cursor.fetchone()
+            return dict(summary) if summary else None
+
+    def upsert_chat_summary(self, chat_id, summary, last_message_id):
+        with self.get_connection() as conn:
+            conn.execute(
+                """INSERT INTO chat_summaries (chat_id, summary, last_message_id) VALUES (?, ?, ?)
+                ON CONFLICT(chat_id) DO UPDATE SET summary = excluded.summary, last_message_id = excluded.last_message_id, updated_at = CURRENT_TIMESTAMP""",
+                (chat_id, summary, last_message_id))
+            conn.commit()
+
     def get_last_message(self, chat_id):
         with self.get_connection() as conn:
             cursor = conn.execute("SELECT * FROM messages WHERE chat_id = ? ORDER BY id DESC LIMIT 1", (chat_id,))
             return dict(cursor.fetchone())
 
+    def insert_job(self, session_id, payload):
+        with self.get_connection() as conn:
+            cursor = conn.execute("INSERT INTO jobs (session_id, payload) VALUES (?, ?) RETURNING *", (session_id, payload))
+            job = cursor.fetchone()
+            conn.commit()
+            return dict(job) if job else None
+
+    def get_job(self, job_id):
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            job = cursor.fetchone()
+            return dict(job) if job else None
+
+    def get_latest_job(self, session_id):
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT * FROM jobs WHERE session_id = ? ORDER BY id DESC LIMIT 1", (session_id,))
+            job = cursor.fetchone()
+            return dict(job) if job else None
+
+    def get_jobs_by_status(self, statuses):
+        with self.get_connection() as conn:
+            placeholders = ", ".join("?" for _ in statuses)
+            cursor = conn.execute(f"SELECT * FROM jobs WHERE status IN ({placeholders}) ORDER BY id", tuple(statuses))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def update_job(self, job_id, **fields):
+        columns = ", ".join(f"{column} = ?" for column in fields)
+        with self.get_connection() as conn:
+            conn.execute(f"UPDATE jobs SET {columns}, updated_at = CURRENT_TIMESTAMP WHERE id = ?", (*fields.values(), job_id))
+            conn.commit()
+
 
 db_client = DatabaseClient()
\ No newline at end of file
@@ -0,0 +1,12 @@
+-- chat lookups filter on all three columns (get_chat, get_chats)
+CREATE INDEX IF NOT EXISTS idx_chats_session_node_type ON chats (session_id, node_id, type);
+
+-- chat history is always read per chat ordered by id
+CREATE INDEX IF NOT EXISTS idx_messages_chat_id ON messages (chat_id, id);
+
+CREATE INDEX IF NOT EXISTS idx_sources_session_id ON sources (session_id);
+
+CREATE INDEX IF NOT EXISTS idx_files_filename ON files (filename);
+
+CREATE INDEX IF NOT EXISTS idx_jobs_session_id ON jobs (session_id, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
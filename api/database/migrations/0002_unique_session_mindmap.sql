@@ -0,0 +1,4 @@
+-- a session has exactly one mindmap, keep the newest if older rows piled up
+DELETE FROM mindmaps WHERE id NOT IN (SELECT MAX(id) FROM mindmaps GROUP BY session_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_mindmaps_session_id ON mindmaps (session_id);
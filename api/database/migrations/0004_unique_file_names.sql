@@ -0,0 +1,5 @@
+-- uploads are named by content hash, concurrent uploads of the same bytes must share one row
+DELETE FROM files WHERE id NOT IN (SELECT MIN(id) FROM files GROUP BY filename);
+
+DROP INDEX IF EXISTS idx_files_filename;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_files_filename ON files (filename);
@@ -0,0 +1,28 @@
+-- index the session id next to the text, so MATCH only walks one session's postings
+DROP TRIGGER IF EXISTS chunks_after_insert;
+DROP TRIGGER IF EXISTS chunks_after_delete;
+DROP TRIGGER IF EXISTS chunks_after_update;
+DROP TABLE IF EXISTS chunks_fts;
+
+CREATE VIRTUAL TABLE chunks_fts USING fts5(
+    content,
+    session_id,
+    content='chunks',
+    content_rowid='id',
+    tokenize='porter unicode61'
+);
+
+CREATE TRIGGER chunks_after_insert AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts (rowid, content, session_id) VALUES (new.id, new.content, new.session_id);
+END;
+
+CREATE TRIGGER chunks_after_delete AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, content, session_id) VALUES ('delete', old.id, old.content, old.session_id);
+END;
+
+CREATE TRIGGER chunks_after_update AFTER UPDATE OF content, session_id ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, content, session_id) VALUES ('delete', old.id, old.content, old.session_id);
+    INSERT INTO chunks_fts (rowid, content, session_id) VALUES (new.id, new.content, new.session_id);
+END;
+
+INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild');
@@ -47,4 +47,26 @@ CREATE TABLE IF NOT EXISTS messages (
     content TEXT NOT NULL,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (chat_id) REFERENCES chats(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending', -- pending, running, completed, failed, cancelled
+    stage TEXT,
+    progress TEXT NOT NULL DEFAULT '{}', -- json: stage -> {"done": n, "total": n}
+    payload TEXT NOT NULL, -- json: the sources the job ingests
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (session_id) REFERENCES sessions(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS chat_summaries (
+    chat_id INTEGER PRIMARY KEY,
+    summary TEXT NOT NULL,
+    last_message_id INTEGER NOT NULL, -- newest message folded into the summary
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (chat_id) REFERENCES chats(id) ON DELETE CASCADE
 );
\ No newline at end of file
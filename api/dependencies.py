@@ -0,0 +1,23 @@
+from services.chats import chat_service, ChatService
+from services.docs import docs_service, DocsService
+from services.files import files_service, FilesService
+from services.messages import message_service, MessageService
+from services.sessions import session_service, SessionService
+
+# routes take their services through Depends, so tests can swap them with app.dependency_overrides.
+# async so fastapi resolves them on the event loop instead of a threadpool hop per request
+
+async def get_chat_service() -> ChatService:
+    return chat_service
+
+async def get_docs_service() -> DocsService:
+    return docs_service
+
+async def get_files_service() -> FilesService:
+    return files_service
+
+async def get_message_service() -> MessageService:
+    return message_service
+
+async def get_session_service() -> SessionService:
+    return session_service
@@ -0,0 +1,217 @@
+import asyncio
+import hashlib
+import json
+import math
+import re
+import time
+from collections import Counter
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel, LLM
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+
+# deterministic stand-ins for gemini and tavily, used by the benchmark and by LLM_BACKEND=fake.
+# every call can sleep for a fixed latency so the rest of the pipeline sees realistic waits.
+
+FAKE_EMBEDDING_SIZE = 3072  # same width as gemini-embedding-001, so chroma does the same work
+FAKE_ANSWER_WORDS = 60
+FAKE_SUMMARY_WORDS = 40
+FAKE_MINDMAP_SUBJECTS = 5
+FAKE_MINDMAP_CHILDREN = 3
+MINDMAP_DOCUMENT_MARKER = "Generate a mindmap about the following document:"
+
+WORD_PATTERN = re.compile(r"[a-z]{5,}")
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _keywords(text, limit):
+    counts = Counter(WORD_PATTERN.findall(text.lower()))
+    return [word for word, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]]
+
+
+def _message_text(message):
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+
+
+class FakeChatModel(BaseChatModel):
+    latency: float = 0.0
+    answer_words: int = FAKE_ANSWER_WORDS
+    # searches requested per assistant step and how many steps ask for them, when tools are bound
+    tool_calls_per_step: int = 1
+    tool_rounds: int = 1
+    # text sent along with the searches, some models narrate before they call a tool
+    tool_preamble: str = ""
+    tool_names: list[str] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tool_names": [tool.name for tool in tools]})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        yield from self._chunks(self._respond(messages))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(self._respond(messages)):
+            yield chunk
+
+    def _respond(self, messages):
+        question = next((_message_text(m) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        rounds = sum(1 for m in messages if isinstance(m, AIMessage) and m.tool_calls)
+        if self.tool_names and rounds < self.tool_rounds:
+            suffixes = ["", " overview", " latest", " examples", " history"]
+            tool_calls = [
+                {
+                    "name": self.tool_names[0],
+                    "args": {"query": (question[:100] + suffixes[i % len(suffixes)]).strip()},
+                    "id": f"call_{_digest(f'{question}:{rounds}:{i}')[:12]}",
+                }
+                for i in range(self.tool_calls_per_step)
+            ]
+            return AIMessage(content=self.tool_preamble, tool_calls=tool_calls)
+
+        # reuse words from the whole prompt, so the answer size follows the context like a real model
+        context = " ".join(_message_text(m) for m in messages)
+        words = WORD_PATTERN.findall(context.lower()) or ["answer"]
+        offset = int(_digest(context)[:8], 16) % len(words)
+        body = " ".join(words[(offset + i) % len(words)] for i in range(self.answer_words))
+        return AIMessage(content=f"About {question[:60]}: {body}")
+
+    def _chunks(self, message):
+        for word in message.content.split(" ") if message.content else []:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                for i, call in enumerate(message.tool_calls)
+            ]))
+
+
+class FakeLLM(LLM):
+    latency: float = 0.0
+    summary_words: int = FAKE_SUMMARY_WORDS
+
+    @property
+    def _llm_type(self):
+        return "fake-completion"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self._complete(prompt)
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._complete(prompt)
+
+    def _complete(self, prompt):
+        if MINDMAP_DOCUMENT_MARKER in prompt:
+            return json.dumps(self._mindmap(prompt.split(MINDMAP_DOCUMENT_MARKER, 1)[1]))
+        return " ".join(_keywords(prompt, self.summary_words))
+
+    def _mindmap(self, document):
+        # subjects are the most frequent words of the corpus, so node queries find real chunks
+        keywords = _keywords(document, FAKE_MINDMAP_SUBJECTS * (FAKE_MINDMAP_CHILDREN + 1)) or ["document"]
+        subjects = keywords[:FAKE_MINDMAP_SUBJECTS]
+        details = keywords[FAKE_MINDMAP_SUBJECTS:]
+        return {
+            "title": " ".join(subjects[:2]).title(),
+            "description": f"Overview of {', '.join(subjects)}",
+            "children": [
+                {
+                    "title": subject.title(),
+                    "description": f"What the document says about {subject}",
+                    "children": [
+                        {"title": f"{subject} {detail}".title(), "description": f"{detail} in the context of {subject}", "children": []}
+                        for detail in details[i::FAKE_MINDMAP_SUBJECTS][:FAKE_MINDMAP_CHILDREN]
+                    ],
+                }
+                for i, subject in enumerate(subjects)
+            ],
+        }
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, size=FAKE_EMBEDDING_SIZE, latency=0.0):
+        self.size = size
+        self.latency = latency
+
+    def embed_documents(self, texts):
+        # one round trip per batch, like the real client
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.latency)
+        return self._embed(text)
+
+    def _embed(self, text):
+        # hashed bag of words, texts that share words end up close to each other
+        vector = [0.0] * self.size
+        for word in WORD_PATTERN.findall(text.lower()):
+            vector[int(_digest(word)[:8], 16) % self.size] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+
+class FakeSearchInput(BaseModel):
+    query: str = Field(description="Search query to look up")
+
+
+class FakeSearchTool(BaseTool):
+    # same name and result shape as TavilySearch, prompts and tool messages look alike
+    name: str = "tavily_search"
+    description: str = "A search engine for current information on the web. Input should be a search query."
+    args_schema: type[BaseModel] = FakeSearchInput
+    latency: float = 0.0
+    max_results: int = 2
+
+    def _run(self, query, **kwargs):
+        time.sleep(self.latency)
+        return self._results(query)
+
+    async def _arun(self, query, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._results(query)
+
+    def _results(self, query):
+        digest = _digest(query)
+        return {
+            "query": query,
+            "results": [
+                {
+                    "title": f"{query} ({i + 1})",
+                    "url": f"https://search.invalid/{digest[:12]}/{i + 1}",
+                    "content": f"Result {i + 1} for {query}. " * 5,
+                    "score": round(1 - i * 0.1, 2),
+                }
+                for i in range(self.max_results)
+            ],
+        }
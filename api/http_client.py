@@ -0,0 +1,147 @@
+import codecs
+import html
+import re
+import time
+from pathlib import Path
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from database.cache import SqliteCache
+from utils import LRUCache, lazy_property
+from metrics import span
+
+HTTP_TIMEOUT = (5, 30)  # connect, read
+HTTP_POOL_SIZE = 16
+HTTP_RETRIES = 2
+HTTP_USER_AGENT = "Mozilla/5.0 (compatible; Synaptiq/1.0)"
+HTTP_CACHE_PATH = Path(__file__).parent / ".sqlite" / "http_cache.db"
+HTTP_CACHE_MAX_BYTES = 256 * 1024 * 1024
+HTTP_CACHE_POOL_SIZE = 4
+TITLE_CHUNK_SIZE = 16 * 1024
+TITLE_MAX_BYTES = 2 * 1024 * 1024
+TITLE_CACHE_SIZE = 1024
+TITLE_CACHE_TTL = 24 * 60 * 60
+
+TITLE_PATTERN = re.compile(rb"<title[^>]*>(.*?)</title\s*>", re.IGNORECASE | re.DOTALL)
+CHARSET_PATTERN = re.compile(r"charset=([\w-]+)", re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    encoding TEXT,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used);
+"""
+
+
+class ResponseCache(SqliteCache):
+    table = "responses"
+    key_columns = ("url",)
+    schema = SCHEMA
+
+    def __init__(self, path=HTTP_CACHE_PATH, max_bytes=HTTP_CACHE_MAX_BYTES):
+        super().__init__(path, max_bytes, pool_size=HTTP_CACHE_POOL_SIZE)
+
+    def get(self, url):
+        with self.connection() as conn:
+            row = conn.execute("SELECT * FROM responses WHERE url = ?", (url,)).fetchone()
+            if row:
+                conn.execute("UPDATE responses SET last_used = ? WHERE url = ?", (time.time(), url))
+                conn.commit()
+            return dict(row) if row else None
+
+    def put(self, url, etag, last_modified, encoding, body):
+        self._put_rows([{
+            "url": url, "etag": etag, "last_modified": last_modified, "encoding": encoding,
+            "body": body, "size": len(body), "last_used": time.time(),
+        }])
+
+
+class HttpClient:
+    def __init__(self, cache=None):
+        # one pooled session for every source fetch, connections to the same host are reused
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_SIZE,
+            pool_maxsize=HTTP_POOL_SIZE,
+            max_retries=Retry(total=HTTP_RETRIES, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET",)),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = HTTP_USER_AGENT
+        if cache is not None:
+            self.cache = cache
+        self._titles = LRUCache(max_size=TITLE_CACHE_SIZE, ttl=TITLE_CACHE_TTL)
+
+    @lazy_property
+    def cache(self):
+        return ResponseCache()
+
+    def get_text(self, url):
+        cached = self.cache.get(url)
+        headers = {}
+        if cached and cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        with span("fetch"):
+            response = self.session.get(url, headers=headers, timeout=HTTP_TIMEOUT)
+        if response.status_code == 304 and cached:
+            return cached["body"].decode(cached["encoding"] or "utf-8", errors="replace")
+        response.raise_for_status()
+
+        encoding = self._encoding(response)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        # only pages we can revalidate are worth keeping
+        if (etag or last_modified) and "no-store" not in response.headers.get("Cache-Control", ""):
+            self.cache.put(url, etag, last_modified, encoding, response.content)
+        return response.content.decode(encoding, errors="replace")
+
+    def get_title(self, url):
+        title = self._titles.get(url)
+        if title is not None:
+            return title
+
+        # stream the page and stop at </title>, the rest of a large page is never downloaded
+        buffer = bytearray()
+        with self.session.get(url, timeout=HTTP_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            encoding = self._encoding(response, sniff=False)
+            for chunk in response.iter_content(TITLE_CHUNK_SIZE):
+                buffer += chunk
+                match = TITLE_PATTERN.search(buffer)
+                if match:
+                    title = html.unescape(match.group(1).decode(encoding, errors="replace")).strip()
+                    self._titles.set(url, title)
+                    return title
+                if len(buffer) >= TITLE_MAX_BYTES:
+                    break
+        return None
+
+    def _encoding(self, response, sniff=True):
+        match = CHARSET_PATTERN.search(response.headers.get("Content-Type", ""))
+        if match:
+            try:
+                return codecs.lookup(match.group(1)).name
+            except LookupError:
+                pass
+        if sniff:
+            return response.apparent_encoding or "utf-8"
+        return "utf-8"
+
+
+http_client = HttpClient()
+
+
+def get_yt_title(url):
+    title = http_client.get_title(url)
+    if not title:
+        return url.split("//")[-1]
+    return title.split("- YouTube")[0].strip()
@@ -0,0 +1,53 @@
+import os
+from functools import lru_cache
+
+CHAT_MODEL = "gemini-2.5-flash-lite"
+COMPLETION_MODEL = "gemini-1.5-flash-8b"
+EMBEDDING_MODEL = "models/gemini-embedding-001"
+FAKE_EMBEDDING_MODEL = "fake-embedding"
+WEB_SEARCH_MAX_RESULTS = 2
+
+# "fake" swaps gemini and tavily for the deterministic offline backends in fakes.py
+LLM_BACKEND = os.getenv("LLM_BACKEND", "google").lower()
+FAKE_LATENCY = float(os.getenv("FAKE_LATENCY", "0"))  # seconds added to every fake call
+# the search stub can also be paired with the real models, e.g. to try deepdive chats without tavily
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "fake" if LLM_BACKEND == "fake" else "tavily").lower()
+
+# the client libraries are slow to import and need credentials, so nothing is built until first use
+# and every service shares the same instances
+
+@lru_cache(maxsize=None)
+def get_chat_llm():
+    if LLM_BACKEND == "fake":
+        from fakes import FakeChatModel
+        return FakeChatModel(latency=FAKE_LATENCY)
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model=CHAT_MODEL)
+
+@lru_cache(maxsize=None)
+def get_llm():
+    if LLM_BACKEND == "fake":
+        from fakes import FakeLLM
+        return FakeLLM(latency=FAKE_LATENCY)
+    from langchain_google_genai import GoogleGenerativeAI
+    return GoogleGenerativeAI(model=COMPLETION_MODEL)
+
+@lru_cache(maxsize=None)
+def get_embeddings():
+    if LLM_BACKEND == "fake":
+        from fakes import FakeEmbeddings
+        return FakeEmbeddings(latency=FAKE_LATENCY)
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    return GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)
+
+def get_embedding_model():
+    # cached vectors are keyed by model, fake ones must never be served to the real backend
+    return FAKE_EMBEDDING_MODEL if LLM_BACKEND == "fake" else EMBEDDING_MODEL
+
+@lru_cache(maxsize=None)
+def get_web_search_tool():
+    if SEARCH_BACKEND == "fake":
+        from fakes import FakeSearchTool
+        return FakeSearchTool(latency=FAKE_LATENCY, max_results=WEB_SEARCH_MAX_RESULTS)
+    from langchain_tavily import TavilySearch
+    return TavilySearch(max_results=WEB_SEARCH_MAX_RESULTS)
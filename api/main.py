@@ -1,13 +1,23 @@
 from dotenv import load_dotenv
 load_dotenv(dotenv_path=".env")
-from utils import check_env_vars
-check_env_vars()
+from utils import check_env_vars, NEXT_CURSOR_HEADER
 
+import os
 import sqlite3
+import time
+import uuid
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from database.client import db_client
+from services.jobs import job_service
+from vectorstore.client import vectorstore_client
+from llm import get_chat_llm, get_llm, get_web_search_tool
+from metrics import registry, request_id_var, http_request_seconds, http_requests, configure_logging
 
 from routes.chats import router as chats_router
 from routes.sessions import router as sessions_router
@@ -15,7 +25,38 @@ from routes.docs import router as docs_router
 from routes.messages import router as messages_router
 from routes.files import router as files_router
 
+# clients are built on first use, set WARMUP_ON_STARTUP=true to pay that cost before serving instead
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+REQUEST_ID_HEADER = "X-Request-ID"
+
+configure_logging(LOG_LEVEL)
+
+def warm_up():
+    vectorstore_client.client
+    get_llm()
+    get_chat_llm()
+    get_web_search_tool()
+
+@asynccontextmanager
+async def lifespan(app):
+    check_env_vars()
+    await run_in_threadpool(db_client.init_database)
+    # the gemini embedding client binds its async channel to the loop of the thread that builds it,
+    # so it is built here and never lazily on an ingestion or threadpool thread
+    vectorstore_client.embeddings
+    if vectorstore_client.needs_legacy_migration():
+        # older installs kept every session in one collection, move them once before any read
+        await run_in_threadpool(vectorstore_client.migrate_legacy_documents)
+    job_service.start()
+    if WARMUP_ON_STARTUP:
+        await run_in_threadpool(warm_up)
+    yield
+    job_service.shutdown()
+    db_client.close()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Synaptiq",
     description="An AI-powered learning assistant that enables interactive Q&A using mindmaps",
     version="1.0.0",
@@ -29,8 +70,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],    
+    expose_headers=[NEXT_CURSOR_HEADER, REQUEST_ID_HEADER],
 )
 
+@app.middleware("http")
+async def observe_requests(request, call_next):
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+    finally:
+        # label by route template so /sessions/1 and /sessions/2 share a series
+        route = request.scope.get("route")
+        labels = (request.method, route.path if route else "unmatched", str(status))
+        http_request_seconds.observe(time.perf_counter() - start, *labels)
+        http_requests.inc(*labels)
+        request_id_var.reset(token)
+
 @app.exception_handler(ValueError)
 async def value_error_exception_handler(request, exc):
     return JSONResponse(
@@ -72,6 +133,10 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 app.include_router(sessions_router)
 app.include_router(docs_router)
 app.include_router(chats_router)
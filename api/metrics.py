@@ -0,0 +1,185 @@
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+# set per http request by the middleware in main.py, threadpool calls inherit it
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+
+def with_context(fn):
+    # executors do not copy contextvars, so the request id is carried to the worker explicitly.
+    # each call runs in its own copy, a context can only be entered by one thread at a time
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, *label_values):
+        entry = self._values.get(label_values)
+        return entry[2] if entry else 0
+
+    def totals(self):
+        with self._lock:
+            return {label_values: (entry[2], entry[1]) for label_values, entry in self._values.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (bucket_counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels + ("le",), label_values + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels + ("le",), label_values + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+    "synaptiq_stage_seconds", "Time spent in each stage of a request or ingestion job", labels=("stage",)))
+stage_errors = registry.register(Counter(
+    "synaptiq_stage_errors_total", "Stages that ended with an exception", labels=("stage",)))
+http_request_seconds = registry.register(Histogram(
+    "synaptiq_http_request_seconds", "HTTP request latency", labels=("method", "route", "status")))
+http_requests = registry.register(Counter(
+    "synaptiq_http_requests_total", "HTTP requests served", labels=("method", "route", "status")))
+
+logger = logging.getLogger("synaptiq.spans")
+
+
+def _record(stage, elapsed):
+    stage_seconds.observe(elapsed, stage)
+    logger.debug("%s took %.1fms", stage, elapsed * 1000)
+
+
+@contextmanager
+def span(stage, errors=Exception):
+    # cancellations and generator exits are not failures of the stage, errors narrows what is
+    start = time.perf_counter()
+    try:
+        yield
+    except errors:
+        stage_errors.inc(stage)
+        raise
+    finally:
+        _record(stage, time.perf_counter() - start)
+
+
+async def timed_aiter(stage, iterable):
+    # one observation for the whole stream, only the waits on the source count, not the consumer
+    iterator = aiter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = await anext(iterator)
+            except StopAsyncIteration:
+                return
+            except Exception:
+                stage_errors.inc(stage)
+                raise
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        _record(stage, elapsed)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+def get_logger(name):
+    return logging.getLogger(f"synaptiq.{name}")
+
+
+def configure_logging(level=logging.INFO):
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(RequestIdFilter())
+    root = logging.getLogger("synaptiq")
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    root.propagate = False
@@ -1,19 +1,23 @@
-from fastapi import APIRouter
-from services.chats import chat_service
+from fastapi import APIRouter, Depends, Query, Response
+from dependencies import get_chat_service
+from services.chats import ChatService
 from pydantic import BaseModel
 from enum import Enum
-from utils import get_yt_video_id
+from utils import get_yt_video_id, PAGE_MAX_LIMIT, set_next_cursor
 
 router = APIRouter(prefix = "/chats", tags = ["chats"])
 
 
 @router.post("/")
-def create_chat(session_id: str, node_id: str, chat_type: str):
-    chat = chat_service.create_new_chat(session_id, int(node_id), chat_type)
+async def create_chat(session_id: str, node_id: str, chat_type: str, chat_service: ChatService = Depends(get_chat_service)):
+    chat = await chat_service.acreate_new_chat(session_id, int(node_id), chat_type)
     return chat
 
 @router.get("/")
-def get_chat(session_id: str, node_id: str, chat_type: str):
-    chat = chat_service.get_chat(session_id, int(node_id), chat_type)
+def get_chat(session_id: str, node_id: str, chat_type: str, response: Response, limit: int = Query(None, ge=1, le=PAGE_MAX_LIMIT), cursor: int = None, chat_service: ChatService = Depends(get_chat_service)):
+    chat = chat_service.get_chat(session_id, int(node_id), chat_type, limit, cursor)
+    # messages come oldest first, so the next page continues before the first one
+    messages = chat["messages"]
+    set_next_cursor(response, messages, limit, messages[0]["id"] if messages else None)
     return chat
 
@@ -1,16 +1,20 @@
-from fastapi import APIRouter
-from services.docs import docs_service
+from fastapi import APIRouter, Depends, Query, Response
+from dependencies import get_docs_service
+from services.docs import DocsService
+from utils import PAGE_MAX_LIMIT, set_next_cursor
 
 router = APIRouter(prefix="/docs", tags=["docs"])
 
 @router.get("/") 
-def get_all_session_docs(session_id):
-    docs = docs_service.get_all_docs(session_id)
+def get_all_session_docs(session_id, response: Response, limit: int = Query(None, ge=1, le=PAGE_MAX_LIMIT), cursor: int = Query(None, ge=0), docs_service: DocsService = Depends(get_docs_service)):
+    # chroma only pages by offset, so the cursor here is the offset of the next page
+    docs = docs_service.get_all_docs(session_id, limit, cursor)
+    set_next_cursor(response, docs, limit, (cursor or 0) + len(docs))
     return docs
 
 @router.get("/query")
-def query_session_docs(session_id, query):
-    docs = docs_service.query_all_docs(query, session_id)
+async def query_session_docs(session_id, query, docs_service: DocsService = Depends(get_docs_service)):
+    docs = await docs_service.aquery_all_docs(query, session_id)
     contents = []
     for doc in docs:
         contents.append(doc.page_content)
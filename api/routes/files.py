@@ -1,20 +1,25 @@
-from fastapi import APIRouter, UploadFile, File
-from services.files import files_service
+from fastapi import APIRouter, Depends, UploadFile, File, Query, Response
+from dependencies import get_files_service
+from services.files import FilesService
+from utils import PAGE_MAX_LIMIT, set_next_cursor
 
 router = APIRouter(prefix="/files", tags=["files"])
 
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    return files_service.upload_file(file)
+async def upload_file(file: UploadFile = File(...), files_service: FilesService = Depends(get_files_service)):
+    return await files_service.upload_file(file)
 
+# the remaining handlers touch sqlite and the disk, so they run in the threadpool as plain defs
 @router.get("/{filename}")
-async def get_file(filename: str):
+def get_file(filename: str, files_service: FilesService = Depends(get_files_service)):
     return files_service.get_file(filename)
     
 @router.get("/")
-async def list_files():
-    return files_service.list_files()
+def list_files(response: Response, limit: int = Query(None, ge=1, le=PAGE_MAX_LIMIT), cursor: int = None, files_service: FilesService = Depends(get_files_service)):
+    files = files_service.list_files(limit, cursor)
+    set_next_cursor(response, files, limit, files[-1]["id"] if files else None)
+    return files
 
 @router.delete("/{filename}")
-async def delete_file(filename: str):
+def delete_file(filename: str, files_service: FilesService = Depends(get_files_service)):
     return files_service.delete_file(filename)
\ No newline at end of file
@@ -1,15 +1,42 @@
-from fastapi import APIRouter
+import json
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from services.messages import message_service
-from services.chats import chat_service
+from dependencies import get_message_service
+from services.messages import MessageService
+from metrics import get_logger
 
 router = APIRouter(prefix="/messages", tags=["messages"])
+logger = get_logger("routes.messages")
 
 class MessageRequest(BaseModel):
     content: str
     chat_id: str
 
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @router.post("/")
-async def add_message(request: MessageRequest):
-    response = message_service.create_new_message(chat_id = request.chat_id, content = request.content)
-    return response
\ No newline at end of file
+async def add_message(request: MessageRequest, message_service: MessageService = Depends(get_message_service)):
+    response = await message_service.acreate_new_message(chat_id = request.chat_id, content = request.content)
+    return response
+
+@router.post("/stream")
+async def stream_message(request: MessageRequest, message_service: MessageService = Depends(get_message_service)):
+    tokens = await message_service.stream_new_message(chat_id = request.chat_id, content = request.content)
+
+    async def events():
+        try:
+            async for token in tokens:
+                yield format_sse("token", {"content": token})
+        except Exception as e:
+            logger.error("Error streaming message: %s", e)
+            yield format_sse("error", {"detail": str(e)})
+            return
+        yield format_sse("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,7 +1,9 @@
-from fastapi import APIRouter
-from services.sessions import session_service
+from fastapi import APIRouter, Depends, Query, Response
+from dependencies import get_session_service
+from services.sessions import SessionService
 from pydantic import BaseModel
 from enum import Enum
+from utils import PAGE_MAX_LIMIT, set_next_cursor
 
 router = APIRouter(prefix = "/sessions", tags = ["sessions"])
 
@@ -16,25 +18,38 @@ class Source(BaseModel):
     title: str = None
 
 @router.get("/")
-def get_sessions():
-    sessions = session_service.get_sessions()
+def get_sessions(response: Response, limit: int = Query(None, ge=1, le=PAGE_MAX_LIMIT), cursor: int = None, session_service: SessionService = Depends(get_session_service)):
+    sessions = session_service.get_sessions(limit, cursor)
+    set_next_cursor(response, sessions, limit, sessions[-1]["id"] if sessions else None)
     return sessions
 
 @router.post("/")
-def create_session(sources: list[Source]):        
-    session_id = session_service.create_new_session(sources)
+def create_session(sources: list[Source], session_service: SessionService = Depends(get_session_service)):        
+    session_id, job_id = session_service.create_new_session(sources)
     
     return {
-        "session_id": session_id
+        "session_id": session_id,
+        "job_id": job_id
     }
 
+@router.get("/{session_id}/status")
+def get_session_status(session_id: str, session_service: SessionService = Depends(get_session_service)):
+    return session_service.get_session_status(session_id)
+
+@router.post("/{session_id}/cancel")
+def cancel_session_job(session_id: str, session_service: SessionService = Depends(get_session_service)):
+    return session_service.cancel_session_job(session_id)
+
+@router.post("/{session_id}/retry")
+def retry_session_job(session_id: str, session_service: SessionService = Depends(get_session_service)):
+    return session_service.retry_session_job(session_id)
+
 @router.delete("/{session_id}")
-def delete_session(session_id: str):
+def delete_session(session_id: str, session_service: SessionService = Depends(get_session_service)):
     session_service.delete_session(session_id)
     return {"message": "Session deleted"}
 
 @router.get("/{session_id}")
-def get_session(session_id: str):
-    print("session_id",session_id)
+def get_session(session_id: str, session_service: SessionService = Depends(get_session_service)):
     session = session_service.get_full_session(session_id)
     return session
\ No newline at end of file
@@ -1,89 +1,354 @@
-from youtube_transcript_api import YouTubeTranscriptApi
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from vectorstore.client import vectorstore_client
 from langchain.docstore.document import Document
-from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader
+from bs4 import BeautifulSoup
 from database.client import db_client
-from utils import get_yt_video_id
+from utils import get_yt_video_id, retry_with_backoff, LRUCache, lazy_property
 from services.files import files_service
+from http_client import http_client
+from metrics import span, get_logger, with_context
+from source_cache import SourceCache, SOURCE_CACHE_TTL, SOURCE_CACHE_MAX_ENTRY_BYTES
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from pathlib import Path
+from fastapi.concurrency import run_in_threadpool
+import asyncio
+import hashlib
+import threading
+import json
+import re
+import time
 
+EMBEDDING_BATCH_SIZE = 100
+EMBEDDING_WORKERS = 2
+EMBEDDING_MAX_RETRIES = 5
+RETRIEVAL_CACHE_SIZE = 1024
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+logger = get_logger("docs")
+
+CHUNKER = f"recursive-{CHUNK_SIZE}-{CHUNK_OVERLAP}"  # cached chunks are only reused with the same splitter
+RETRIEVAL_MODE = "hybrid"  # "keyword" answers from the local full-text index only
+RETRIEVAL_K = 4
+RETRIEVAL_CANDIDATES = 8  # per ranking, before fusion
+RRF_K = 60
+VECTOR_SEARCH_TIMEOUT = 5  # seconds, past this keyword results are served alone
+VECTOR_SEARCH_COOLDOWN = 30  # seconds to skip the vector search after it failed
+VECTOR_SEARCH_MAX_IN_FLIGHT = 4  # running searches, timed out ones included, before keywords are served alone
 
 class DocsService:
     def __init__(self):
         self.vectorstore_client = vectorstore_client
         self.db_client = db_client
         self.files_service = files_service
+        self.http_client = http_client
+        self._retrieval_cache = LRUCache(max_size=RETRIEVAL_CACHE_SIZE)
+        # bumping a session's version orphans every cached result for it
+        self._session_versions = {}
+        self._versions_lock = threading.Lock()
+        self._vector_down_until = 0
+        self._vector_slots = threading.BoundedSemaphore(VECTOR_SEARCH_MAX_IN_FLIGHT)
+        self._vector_executor = ThreadPoolExecutor(VECTOR_SEARCH_MAX_IN_FLIGHT, "vector_search")
+
+    @lazy_property
+    def source_cache(self):
+        return SourceCache()
 
     def add_docs(self, url, source_type, session_id, source_id):
-        if source_type == "youtube":
-            content = self._get_yt_transcript(url)
-        elif source_type == "pdf":
-            content = self._get_pdf_content(url)
-        elif source_type == "web_page":
-            content = self._get_web_page_content(url)
-        docs = self._text_to_docs(content, session_id, source_id)
+        # sources shared across sessions are parsed and chunked once, only the session metadata differs
+        cache_key = self._source_cache_key(url, source_type)
+        chunks = self.source_cache.get(cache_key, CHUNKER)
+        if chunks is not None:
+            docs = (self._make_doc(text, page, session_id, source_id) for page, text in chunks)
+        else:
+            if source_type == "youtube":
+                pages = [(None, self._get_yt_transcript(url))]
+            elif source_type == "pdf":
+                pages = self._iter_pdf_pages(url)
+            elif source_type == "web_page":
+                pages = [(None, self._get_web_page_content(url))]
+            docs = self._cache_chunks(
+                cache_key, SOURCE_CACHE_TTL.get(source_type), self._pages_to_docs(pages, session_id, source_id))
 
-        self._store_vectorized_docs(docs)
+        # docs is a generator, so chunks are embedded while later pages are still being parsed
+        with span("ingest.source"):
+            self._store_vectorized_docs(docs)
+        self.invalidate_retrieval(session_id)
 
-    def get_all_docs(self, session_id):
-        docs = self.vectorstore_client.get_all_session_documents(session_id)
+    def get_all_docs(self, session_id, limit=None, offset=None):
+        docs = self.vectorstore_client.get_all_session_documents(session_id, limit, offset)
         return docs
 
-    def query_all_docs(self, query, session_id):
-        docs = self.vectorstore_client.query(
-            query, filter={"session_id": int(session_id)})
+    def delete_docs(self, session_id):
+        self.vectorstore_client.delete_session_documents(session_id)
+        self.invalidate_retrieval(session_id)
+
+    def delete_source_docs(self, session_id, source_id):
+        self.vectorstore_client.delete_source_documents(session_id, source_id)
+        self.invalidate_retrieval(session_id)
+
+    def query_all_docs(self, query, session_id, mode=None):
+        # for worker threads and scripts, the async clients belong to the app's event loop
+        key, mode = self._retrieval_key(query, session_id, mode)
+        docs = self._retrieval_cache.get(key)
+        if docs is None:
+            with span("retrieval.keyword"):
+                keyword_docs = self._keyword_search(query, key[0])
+            vector_docs = None
+            if mode != "keyword":
+                with span("retrieval.vector"):
+                    vector_docs = self._vector_search(query, key[0])
+            docs = self._rank(key, mode, keyword_docs, vector_docs)
+        return list(docs)
+
+    async def aquery_all_docs(self, query, session_id, mode=None):
+        key, mode = self._retrieval_key(query, session_id, mode)
+        docs = self._retrieval_cache.get(key)
+        if docs is None:
+            with span("retrieval.keyword"):
+                keyword_docs = await run_in_threadpool(self._keyword_search, query, key[0])
+            vector_docs = None
+            if mode != "keyword":
+                with span("retrieval.vector"):
+                    vector_docs = await self._avector_search(query, key[0])
+            docs = self._rank(key, mode, keyword_docs, vector_docs)
+        return list(docs)
+
+    def _retrieval_key(self, query, session_id, mode):
+        session_id = int(session_id)
+        mode = mode or RETRIEVAL_MODE
+        return (session_id, self._session_versions.get(session_id, 0), mode, query), mode
+
+    def _rank(self, key, mode, keyword_docs, vector_docs):
+        if mode == "keyword":
+            docs = keyword_docs
+        elif vector_docs is None:
+            # a keyword-only fallback is not cached, the next call tries the vector search again
+            return keyword_docs[:RETRIEVAL_K]
+        else:
+            docs = self._fuse(vector_docs, keyword_docs)
+        docs = docs[:RETRIEVAL_K]
+        self._retrieval_cache.set(key, docs)
         return docs
 
+    def _keyword_search(self, query, session_id):
+        terms = list(dict.fromkeys(re.findall(r"\w+", query.lower())))
+        if not terms:
+            return []
+        # quoting every term keeps fts5 query syntax in user text from being interpreted
+        match = " OR ".join(f'"{term}"' for term in terms)
+        rows = self.db_client.search_chunks(session_id, match, RETRIEVAL_CANDIDATES)
+        return [Document(id=row["chunk_id"], page_content=row["content"], metadata=json.loads(row["metadata"])) for row in rows]
+
+    async def _avector_search(self, query, session_id):
+        if time.monotonic() < self._vector_down_until:
+            return None
+        # a timed out search keeps running in its executor thread, so it keeps its slot until it returns
+        if not self._vector_slots.acquire(blocking=False):
+            logger.debug("Vector searches saturated, serving keyword results")
+            return None
+        task = asyncio.ensure_future(self.vectorstore_client.aquery(session_id, query, RETRIEVAL_CANDIDATES))
+        task.add_done_callback(self._release_vector_slot)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), VECTOR_SEARCH_TIMEOUT)
+        except Exception as e:
+            self._vector_search_failed(e)
+            return None
+
+    def _vector_search(self, query, session_id):
+        if time.monotonic() < self._vector_down_until:
+            return None
+        if not self._vector_slots.acquire(blocking=False):
+            logger.debug("Vector searches saturated, serving keyword results")
+            return None
+        future = self._vector_executor.submit(with_context(self.vectorstore_client.query), session_id, query, RETRIEVAL_CANDIDATES)
+        future.add_done_callback(self._release_vector_slot)
+        try:
+            return future.result(timeout=VECTOR_SEARCH_TIMEOUT)
+        except Exception as e:
+            self._vector_search_failed(e)
+            return None
+
+    def _release_vector_slot(self, future):
+        self._vector_slots.release()
+        if not future.cancelled():
+            # a late failure was already reported as a timeout
+            future.exception()
+
+    def _vector_search_failed(self, error):
+        logger.warning("Vector search unavailable, serving keyword results: %r", error)
+        self._vector_down_until = time.monotonic() + VECTOR_SEARCH_COOLDOWN
+
+    def _fuse(self, *rankings):
+        # reciprocal rank fusion, chunks found by both searches rise to the top
+        scores, docs = {}, {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking):
+                key = doc.id or doc.page_content
+                scores[key] = scores.get(key, 0) + 1 / (RRF_K + rank + 1)
+                docs.setdefault(key, doc)
+        return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+    def query_node_docs(self, node, session_id):
+        return self.query_all_docs(self._node_query(node), session_id)
+
+    async def aquery_node_docs(self, node, session_id):
+        return await self.aquery_all_docs(self._node_query(node), session_id)
+
+    def _node_query(self, node):
+        return node.get("title", "") + " " + node.get("description", "")
+
+    def invalidate_retrieval(self, session_id):
+        session_id = int(session_id)
+        # ingestion threads invalidate concurrently, a lost increment would keep stale results reachable
+        with self._versions_lock:
+            self._session_versions[session_id] = self._session_versions.get(session_id, 0) + 1
+
     def _get_yt_transcript(self, url):
+        from youtube_transcript_api import YouTubeTranscriptApi
         ytt_api = YouTubeTranscriptApi()
         video_id = get_yt_video_id(url)
         fetched_transcript = ytt_api.fetch(video_id)
 
-        full_transcript = ""
-        for snippet in fetched_transcript:
-            full_transcript += snippet.text + " "
+        return " ".join(snippet.text for snippet in fetched_transcript)
 
-        return full_transcript
-
-    def _get_pdf_content(self, url):
+    def _iter_pdf_pages(self, url):
         # TODO: use a pdf parser (markitdown)
+        # langchain_community is slow to import, only pay for it when a pdf comes in
+        from langchain_community.document_loaders import PyPDFLoader
         if url.startswith("/"):
             url = url[1:]
         loader = PyPDFLoader(url)
-        docs = loader.load()
-        full_text = ""
-        for doc in docs:
-            full_text += doc.page_content + " "
-        return full_text
+        for doc in loader.lazy_load():
+            yield doc.metadata.get("page", 0) + 1, doc.page_content
 
     def _get_web_page_content(self, url):
         try:
-            loader = WebBaseLoader([url])
-            docs = loader.load()
-            full_text = ""
-            for doc in docs:
-                full_text += doc.page_content + " "
-            return full_text
+            page = self.http_client.get_text(url)
+            return BeautifulSoup(page, "html.parser").get_text()
         except Exception as e:
-            print("Error loading web page:", e)
+            logger.error("Error loading web page %s: %s", url, e)
             raise e
 
-    def _text_to_docs(self, text, session_id, source_id):
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=200)
-        chunks = text_splitter.split_text(text)
+    def _source_cache_key(self, url, source_type):
+        if source_type == "youtube":
+            return f"youtube:{get_yt_video_id(url)}"
+        if source_type == "pdf":
+            return f"pdf:{self._file_hash(url)}"
+        return f"{source_type}:{url}"
+
+    def _file_hash(self, url):
+        path = Path(url.lstrip("/"))
+        # uploads are stored under their sha256, older ones are hashed on the fly
+        if re.fullmatch(r"[0-9a-f]{64}", path.stem):
+            return path.stem
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def _cache_chunks(self, cache_key, ttl, docs):
+        # large sources are not cached, holding all their chunks would undo the page by page parsing
+        chunks, size = [], 0
+        for doc in docs:
+            if chunks is not None:
+                size += len(doc.page_content)
+                chunks.append((doc.metadata.get("page"), doc.page_content))
+                if size > SOURCE_CACHE_MAX_ENTRY_BYTES:
+                    logger.info("Not caching %s, its chunks exceed %d bytes", cache_key, SOURCE_CACHE_MAX_ENTRY_BYTES)
+                    chunks = None
+            yield doc
+        # only reached when the whole source went through, a failed parse is never cached
+        if chunks is not None:
+            self.source_cache.put(cache_key, CHUNKER, chunks, ttl=ttl)
+
+    def _make_doc(self, chunk, page, session_id, source_id):
         metadata = {
             "session_id": session_id,
             "source_id": source_id
         }
-        docs = [Document(page_content=chunk, metadata=metadata)
-                for chunk in chunks]
-        return docs
+        if page is not None:
+            metadata["page"] = page
+        return Document(page_content=chunk, metadata=metadata)
+
+    def _pages_to_docs(self, pages, session_id, source_id):
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True)
+
+        def to_doc(chunk, page):
+            return self._make_doc(chunk, page, session_id, source_id)
+
+        # the buffer only ever holds the unfinished tail plus the current page, chunks may span pages
+        buffer = ""
+        page_offsets = []
+        for page, text in pages:
+            page_offsets.append((len(buffer), page))
+            buffer += text + " "
+            splits = text_splitter.create_documents([buffer])
+            cut = splits[-1].metadata["start_index"] if len(splits) > 1 else -1
+            if cut <= 0:
+                continue
+
+            for split in splits[:-1]:
+                yield to_doc(split.page_content, self._page_at(page_offsets, split.metadata["start_index"]))
+
+            page_offsets = [(0, self._page_at(page_offsets, cut))] + [
+                (offset - cut, page) for offset, page in page_offsets if offset > cut]
+            buffer = buffer[cut:]
+
+        if buffer.strip():
+            for split in text_splitter.create_documents([buffer]):
+                yield to_doc(split.page_content, self._page_at(page_offsets, split.metadata["start_index"]))
+
+    def _page_at(self, page_offsets, index):
+        current = None
+        for offset, page in page_offsets:
+            if offset > index:
+                break
+            current = page
+        return current
 
     def _store_vectorized_docs(self, docs):
-        ids = self.vectorstore_client.add_documents(docs)
-        print("ids", ids)
+        # ids are deterministic per source and chunk, so a retried batch overwrites instead of duplicating
+        ids = []
+        batch_count = 0
+        with ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS, thread_name_prefix="embedding") as executor:
+            # bound the batches in flight so a huge document never sits in memory all at once
+            in_flight = deque()
+            for batch in self._batched(docs, EMBEDDING_BATCH_SIZE):
+                batch_ids = [f"{doc.metadata['source_id']}-{len(ids) + index}" for index, doc in enumerate(batch)]
+                ids.extend(batch_ids)
+                batch_count += 1
+                in_flight.append(executor.submit(with_context(self._store_batch), batch, batch_ids))
+                if len(in_flight) >= EMBEDDING_WORKERS * 2:
+                    in_flight.popleft().result()
+            while in_flight:
+                in_flight.popleft().result()
+
+        logger.info("stored %d chunks in %d batches", len(ids), batch_count)
         return ids
 
+    def _batched(self, docs, size):
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _store_batch(self, docs, ids):
+        # a batch never spans sources, so every doc in it belongs to the same session
+        session_id = docs[0].metadata["session_id"]
+        self.db_client.insert_chunks(session_id, [
+            (id_, doc.metadata["source_id"], doc.page_content, json.dumps(doc.metadata)) for doc, id_ in zip(docs, ids)])
+        with span("ingest.embed_batch"):
+            retry_with_backoff(
+                lambda: self.vectorstore_client.add_documents(session_id, docs, ids=ids),
+                retries=EMBEDDING_MAX_RETRIES
+            )
+
 
 docs_service = DocsService()
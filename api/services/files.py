@@ -1,35 +1,71 @@
 from fastapi import HTTPException, UploadFile
 from fastapi.responses import FileResponse
-import shutil
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path
+import hashlib
+import os
 import uuid
 from database.client import db_client
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_BYTES = 50 * 1024 * 1024
+
 class FilesService:
     def __init__(self):
         self.files_dir = Path("files")
         self.files_dir.mkdir(exist_ok=True)
         self.db_client = db_client
     
-    def upload_file(self, file: UploadFile):
+    async def upload_file(self, file: UploadFile):
+        file_extension = Path(file.filename).suffix.lower() if file.filename else ""
+        
+        if file_extension != '.pdf':
+            raise HTTPException(status_code=400, detail="Only PDF files are allowed")
+
+        if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"File is larger than {UPLOAD_MAX_BYTES // (1024 * 1024)}MB")
+
+        # stream into a temp file while hashing, the final name is the content hash
+        temp_path = self.files_dir / f".upload-{uuid.uuid4().hex}"
         try:
-            file_extension = Path(file.filename).suffix.lower() if file.filename else ""
-            
-            if file_extension != '.pdf':
-                raise HTTPException(status_code=400, detail="Only PDF files are allowed")
-            
-            unique_filename = f"{uuid.uuid4().hex}{file_extension}"
-            file_path = self.files_dir / unique_filename
-            
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            file_id = self.db_client.insert_file(unique_filename, file.filename, file.content_type, file_path.stat().st_size)
+            hasher = hashlib.sha256()
+            size = 0
+            buffer = await run_in_threadpool(open, temp_path, "wb")
+            try:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > UPLOAD_MAX_BYTES:
+                        raise HTTPException(status_code=413, detail=f"File is larger than {UPLOAD_MAX_BYTES // (1024 * 1024)}MB")
+                    await run_in_threadpool(self._write_chunk, buffer, hasher, chunk)
+            finally:
+                await run_in_threadpool(buffer.close)
+
+            content_hash = hasher.hexdigest()
+            filename = f"{content_hash}{file_extension}"
+            file_path = self.files_dir / filename
+
+            existing = await run_in_threadpool(self.db_client.get_file_by_filename, filename)
+            if existing and file_path.exists():
+                # same bytes were uploaded before, reuse the stored copy and everything derived from it
+                return existing["id"]
+
+            await run_in_threadpool(os.replace, temp_path, file_path)
+            # returns the existing row when the same file was recorded in the meantime
+            file_id = await run_in_threadpool(self.db_client.insert_file, filename, file.filename, file.content_type, size)
             
             return file_id
         
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Could not upload file: {str(e)}")
+        finally:
+            # a no-op once the temp file was moved into place
+            await run_in_threadpool(temp_path.unlink, missing_ok=True)
+
+    def _write_chunk(self, buffer, hasher, chunk):
+        hasher.update(chunk)
+        buffer.write(chunk)
     
     def get_file(self, filename: str):
         file_path = self.files_dir / filename
@@ -47,8 +83,8 @@ class FilesService:
             headers={"Content-Disposition": "inline"}
         )
     
-    def list_files(self):
-        files = self.db_client.get_all_files()
+    def list_files(self, limit=None, cursor=None):
+        files = self.db_client.get_all_files(limit, cursor)
         return files
     
     def delete_file(self, filename: str):
@@ -58,8 +94,7 @@ class FilesService:
         
         try:
             # Get file record from database to get the file ID
-            files = self.db_client.get_all_files()
-            file_record = next((f for f in files if f['filename'] == filename), None)
+            file_record = self.db_client.get_file_by_filename(filename)
             
             if file_record:
                 # Delete from database first
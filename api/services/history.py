@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.prompts import ChatPromptTemplate
+from database.client import db_client
+from llm import get_chat_llm
+from utils import estimate_tokens, lazy_property
+from metrics import span, get_logger, with_context
+
+logger = get_logger("history")
+
+HISTORY_TOKEN_BUDGET = 4000
+HISTORY_MAX_MESSAGES = 40
+
+class HistoryService:
+    def __init__(self, llm=None):
+        self.db_client = db_client
+        if llm is not None:
+            self.llm = llm
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        self._compacting = set()
+        self._lock = threading.Lock()
+
+    @lazy_property
+    def llm(self):
+        return get_chat_llm()
+
+    def get_history(self, chat_id):
+        summary = self.db_client.get_chat_summary(chat_id)
+        after_id = summary["last_message_id"] if summary else 0
+        recent = self.db_client.get_recent_messages(chat_id, after_id, HISTORY_MAX_MESSAGES)
+
+        history = []
+        if summary:
+            history.append({"role": "system", "content": f"Summary of the earlier conversation: {summary['summary']}"})
+        history.extend(self._fit_budget(recent))
+        return history
+
+    def schedule_compaction(self, chat_id):
+        with self._lock:
+            if chat_id in self._compacting:
+                return
+            self._compacting.add(chat_id)
+        self.executor.submit(with_context(self._compact), chat_id)
+
+    def _fit_budget(self, messages):
+        # newest turns first, the latest message always makes it in
+        window, budget = [], HISTORY_TOKEN_BUDGET
+        for message in reversed(messages):
+            tokens = estimate_tokens(message["content"])
+            if window and tokens > budget:
+                break
+            window.append(message)
+            budget -= tokens
+        return list(reversed(window))
+
+    def _compact(self, chat_id):
+        try:
+            summary = self.db_client.get_chat_summary(chat_id)
+            after_id = summary["last_message_id"] if summary else 0
+            window = self._fit_budget(self.db_client.get_recent_messages(chat_id, after_id, HISTORY_MAX_MESSAGES))
+            if not window:
+                return
+
+            overflow = self.db_client.get_messages_between(chat_id, after_id, window[0]["id"])
+            if not overflow:
+                return
+
+            new_summary = self._summarize(summary["summary"] if summary else "", overflow)
+            self.db_client.upsert_chat_summary(chat_id, new_summary, overflow[-1]["id"])
+        except Exception as e:
+            logger.error("Error compacting chat history %s: %s", chat_id, e)
+        finally:
+            with self._lock:
+                self._compacting.discard(chat_id)
+
+    def _summarize(self, summary, messages):
+        prompt_template = ChatPromptTemplate([
+            ("system", """
+             You maintain a running summary of a learning conversation between a user and an assistant. Update the summary with the new messages.
+             Keep the topics covered, the questions asked, the answers given and where the user struggled. You will just generate the summary, you will not generate any other text.
+             """),
+            ("user",
+             "Current summary: {summary}\n\nNew messages:\n{messages}")
+        ])
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+        prompt = prompt_template.invoke({"summary": summary or "(empty)", "messages": transcript})
+        with span("llm.summary"):
+            return self.llm.invoke(prompt).content
@@ -0,0 +1,188 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from database.client import db_client
+from metrics import span, get_logger, with_context
+
+JOB_WORKERS = 4
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF = 2  # seconds, doubled after every failed attempt
+
+ACTIVE_STATUSES = ("pending", "running")
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+logger = get_logger("jobs")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobRun:
+    # one queued or running attempt, its events are never shared with a later retry
+    def __init__(self):
+        self.cancel_event = threading.Event()
+        self.finished = threading.Event()
+
+
+class JobContext:
+    def __init__(self, db_client, job_id, cancel_event):
+        self.db_client = db_client
+        self.job_id = job_id
+        self.cancel_event = cancel_event
+        self.progress = {}
+        self._lock = threading.Lock()
+
+    def start_stage(self, stage, total, cancellable=True):
+        if cancellable:
+            self.check_cancelled()
+        with self._lock:
+            self.progress[stage] = {"done": 0, "total": total}
+            self.db_client.update_job(self.job_id, stage=stage, progress=json.dumps(self.progress))
+
+    def advance(self, stage, step=1):
+        with self._lock:
+            self.progress[stage]["done"] += step
+            self.db_client.update_job(self.job_id, progress=json.dumps(self.progress))
+
+    def fail_item(self, stage, item, error):
+        with self._lock:
+            self.progress[stage].setdefault("failed", []).append({"item": item, "error": error})
+            self.db_client.update_job(self.job_id, progress=json.dumps(self.progress))
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+
+class JobService:
+    def __init__(self):
+        self.db_client = db_client
+        self.executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        # called once from the app lifespan, not at import, so tests and tools can import freely.
+        # jobs live in this process only, so the api must run as a single worker (see README)
+        self._fail_interrupted_jobs()
+
+    def shutdown(self):
+        with self._lock:
+            runs = list(self._runs.values())
+        for run in runs:
+            run.cancel_event.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, session_id, payload, handler):
+        job = self.db_client.insert_job(session_id, json.dumps(payload))
+        self._enqueue(job["id"], handler)
+        return job
+
+    def get_job(self, job_id):
+        job = self.db_client.get_job(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return self._serialize(job)
+
+    def get_session_job(self, session_id):
+        job = self.db_client.get_latest_job(session_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return self._serialize(job)
+
+    def cancel(self, job_id):
+        job = self.db_client.get_job(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] not in ACTIVE_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+
+        with self._lock:
+            run = self._runs.get(job_id)
+            if run:
+                run.cancel_event.set()
+        # a pending job never reaches a checkpoint, so mark it right away
+        if job["status"] == "pending":
+            self.db_client.update_job(job_id, status="cancelled")
+        return self.get_job(job_id)
+
+    def retry(self, job_id, handler):
+        job = self.db_client.get_job(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] not in ("failed", "cancelled"):
+            raise HTTPException(status_code=409, detail=f"Job is {job['status']}, only failed or cancelled jobs can be retried")
+
+        self._enqueue(job_id, handler, before=lambda: self.db_client.update_job(job_id, status="pending", error=None))
+        return self.get_job(job_id)
+
+    def wait(self, job_id, timeout=None):
+        # true once no attempt of the job is queued or running any more
+        with self._lock:
+            run = self._runs.get(job_id)
+        return run is None or run.finished.wait(timeout)
+
+    def _enqueue(self, job_id, handler, before=None):
+        with self._lock:
+            # a cancelled job that never started still has its attempt queued, a second one would race it
+            if job_id in self._runs:
+                raise HTTPException(status_code=409, detail="Job is still stopping, try again shortly")
+            run = self._runs[job_id] = JobRun()
+        if before:
+            before()
+        self.executor.submit(with_context(self._run), job_id, handler, run)
+
+    def _run(self, job_id, handler, run):
+        cancel_event = run.cancel_event
+        try:
+            job = self.db_client.get_job(job_id)
+            if not job or job["status"] != "pending":
+                return
+
+            payload = json.loads(job["payload"])
+            attempts = job["attempts"]
+            for attempt in range(JOB_MAX_ATTEMPTS):
+                if cancel_event.is_set():
+                    self.db_client.update_job(job_id, status="cancelled")
+                    return
+
+                attempts += 1
+                self.db_client.update_job(job_id, status="running", stage=None, progress="{}", error=None, attempts=attempts)
+                try:
+                    with span("job"):
+                        handler(job["session_id"], payload, JobContext(self.db_client, job_id, cancel_event))
+                except JobCancelled:
+                    self.db_client.update_job(job_id, status="cancelled")
+                    return
+                except Exception as e:
+                    logger.warning("Job %s attempt %s failed: %s", job_id, attempts, e)
+                    if attempt == JOB_MAX_ATTEMPTS - 1:
+                        self.db_client.update_job(job_id, status="failed", error=str(e))
+                        return
+                    self.db_client.update_job(job_id, error=str(e))
+                    cancel_event.wait(JOB_RETRY_BACKOFF * 2 ** attempt)
+                    continue
+
+                self.db_client.update_job(job_id, status="completed", stage=None)
+                return
+        finally:
+            with self._lock:
+                if self._runs.get(job_id) is run:
+                    del self._runs[job_id]
+            run.finished.set()
+
+    def _fail_interrupted_jobs(self):
+        # workers do not survive a restart, so anything still active was interrupted
+        for job in self.db_client.get_jobs_by_status(ACTIVE_STATUSES):
+            self.db_client.update_job(job["id"], status="failed", error="Interrupted by server restart")
+
+    def _serialize(self, job):
+        job = dict(job)
+        job["progress"] = json.loads(job["progress"])
+        job.pop("payload", None)
+        return job
+
+
+job_service = JobService()
@@ -1,55 +1,103 @@
+import asyncio
+import json
+import re
 from database.client import db_client
-from langchain_google_genai import ChatGoogleGenerativeAI
 from fastapi import HTTPException
-from utils import get_node_title_desc, parse_json
+from fastapi.concurrency import run_in_threadpool
 from services.docs import docs_service
+from services.mindmaps import mindmap_service
+from services.history import HistoryService
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.messages import ToolMessage
-from langchain_tavily import TavilySearch
+from llm import get_chat_llm, get_web_search_tool
+from utils import lazy_property, LRUCache
+from metrics import span, timed_aiter, get_logger
+
+logger = get_logger("messages")
+
+TOOL_MAX_STEPS = 3  # tool-enabled model calls per turn, the answer is forced after that
+TOOL_MAX_CALLS = 5  # searches run per step, extra calls are answered as skipped
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 15 * 60  # seconds, web results go stale but not within a conversation
 
 class MessageService:
     def __init__(self):
         self.db_client = db_client
         self.docs_service = docs_service
-        self.llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite")
-        self.web_search_tool = TavilySearch(max_results=2)
+        self.mindmap_service = mindmap_service
+        self.history_service = HistoryService()
+        # keyed by normalized query, identical searches across turns and chats are answered once
+        self._search_cache = LRUCache(max_size=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+
+    @lazy_property
+    def llm(self):
+        return get_chat_llm()
+
+    @lazy_property
+    def web_search_tool(self):
+        return get_web_search_tool()
 
     def add_message(self, chat_id, role, content):
         message = self.db_client.insert_message(chat_id, role, content)
         return message
 
-    def get_messages(self, chat_id, desc=True):
-        messages = self.db_client.get_messages(chat_id, desc)
+    def get_messages(self, chat_id, desc=True, limit=None, cursor=None):
+        messages = self.db_client.get_messages(chat_id, desc, limit, cursor)
         return messages
     
     def create_new_message(self, chat_id, content):
-        chat = self.db_client.get_chat_by_id(chat_id)
+        # for scripts and the benchmark, the api only goes through the async path
+        return asyncio.run(self.acreate_new_message(chat_id, content))
+
+    async def acreate_new_message(self, chat_id, content):
+        chat = await run_in_threadpool(self.db_client.get_chat_by_id, chat_id)
         if not chat:
             raise HTTPException(status_code=404, detail="Chat not found")
-        
-        history = self.get_messages(chat_id, desc = False)
-        print("history:", history)
-        response = self.generate_response(
+
+        history = await run_in_threadpool(self.history_service.get_history, chat_id)
+        response = await self.agenerate_response(
             chat["session_id"], chat["node_id"], chat["type"], content, history, web_search=chat["type"] == "deepdive")
-        self.add_message(chat_id, "user", content)
-        self.add_message(chat_id, "assistant", response)
+        await run_in_threadpool(self.add_message, chat_id, "user", content)
+        await run_in_threadpool(self.add_message, chat_id, "assistant", response)
+        self.history_service.schedule_compaction(chat_id)
         return response
-    
-    def generate_response(self, session_id, node_id, chat_type, content, history = None, web_search=False):
-        mindmap = self.db_client.get_mindmap(session_id)
-        mindmap_json = parse_json(mindmap["mindmap_json"]) if mindmap else None
-        node_title, node_desc = get_node_title_desc(mindmap_json, node_id)
-        docs = self.docs_service.query_all_docs(
-            node_title + " " + node_desc, session_id)
-        docs_str = "\n".join([doc.page_content for doc in docs])
 
-        print("web_search:", web_search)
-        response = self._invoke_llm(
+    async def stream_new_message(self, chat_id, content):
+        chat = await run_in_threadpool(self.db_client.get_chat_by_id, chat_id)
+        if not chat:
+            raise HTTPException(status_code=404, detail="Chat not found")
+
+        history = await run_in_threadpool(self.history_service.get_history, chat_id)
+        node_title, mindmap_json, docs_str = await self._abuild_context(chat["session_id"], chat["node_id"])
+        prompt = self._build_prompt(content, chat["type"], node_title, mindmap_json, docs_str, history)
+
+        async def stream():
+            parts = []
+            async for token in self._astream_llm(prompt, web_search=chat["type"] == "deepdive"):
+                parts.append(token)
+                yield token
+            # only persist the turn once the whole answer made it out
+            await run_in_threadpool(self.add_message, chat_id, "user", content)
+            await run_in_threadpool(self.add_message, chat_id, "assistant", "".join(parts))
+            self.history_service.schedule_compaction(chat_id)
+
+        return stream()
+    
+    async def agenerate_response(self, session_id, node_id, chat_type, content, history = None, web_search=False):
+        node_title, mindmap_json, docs_str = await self._abuild_context(session_id, node_id)
+        return await self._ainvoke_llm(
             content, chat_type, node_title, mindmap_json, docs_str, history, web_search)
-        
-        return response
 
-    def _invoke_llm(self, new_message, chat_type, topic, mindmap, docs_str, history, web_search):
+    async def _abuild_context(self, session_id, node_id):
+        # mindmaps are usually cached, but a miss reads sqlite
+        mindmap_json = await run_in_threadpool(self.mindmap_service.get_mindmap, session_id)
+        node = await run_in_threadpool(self.mindmap_service.get_node, session_id, node_id)
+        with span("retrieval"):
+            docs = await self.docs_service.aquery_node_docs(node, session_id)
+        docs_str = "\n".join([doc.page_content for doc in docs])
+        return node.get("title"), mindmap_json, docs_str
+
+    def _build_prompt(self, new_message, chat_type, topic, mindmap, docs_str, history):
         if chat_type == "normal":
             system_prompt = """
 You are a helpful assistant specializing in {topic}. Provide clear, accurate answers based on the mindmap context: {mindmap}
@@ -101,45 +149,139 @@ Guidelines:
 
         messages = [("system", system_prompt)]
         
+        # chat text is literal, braces in it must not be read as template variables
         if history:
             for message in history:
-                messages.append((message["role"], message["content"]))
-        
-        messages.append(("user", new_message))
+                messages.append((message["role"], self._escape_braces(message["content"])))
         
-        prompt_template = ChatPromptTemplate.from_messages(messages)
+        messages.append(("user", self._escape_braces(new_message)))
         
-        prompt = prompt_template.invoke(
-            {"docs_str": docs_str, "topic": topic, "mindmap": mindmap})
+        with span("prompt.build"):
+            prompt_template = ChatPromptTemplate.from_messages(messages)
+            prompt = prompt_template.invoke(
+                {"docs_str": docs_str, "topic": topic, "mindmap": mindmap})
         
         # TODO: check if max tokens is reached
-        
-        # TODO: find a better way to handle web search
-        if web_search:
-            llm_with_tools = self.llm.bind_tools([self.web_search_tool])
-            ai_msg = llm_with_tools.invoke(prompt)
+        return prompt
+
+    def _escape_braces(self, text):
+        return text.replace("{", "{{").replace("}", "}}")
+
+    async def _ainvoke_llm(self, new_message, chat_type, topic, mindmap, docs_str, history, web_search):
+        prompt = self._build_prompt(new_message, chat_type, topic, mindmap, docs_str, history)
 
+        if not web_search:
+            with span("llm"):
+                return (await self.llm.ainvoke(prompt)).content
+
+        llm_with_tools = self.llm.bind_tools([self.web_search_tool])
+        messages = prompt.to_messages()
+        for _ in range(TOOL_MAX_STEPS):
+            with span("llm"):
+                ai_msg = await llm_with_tools.ainvoke(messages)
             if not ai_msg.tool_calls:
                 return ai_msg.content
+            messages.append(ai_msg)
+            messages.extend(await self._arun_tool_calls(ai_msg))
+
+        # out of steps, answer from what the searches found so far
+        with span("llm"):
+            return (await self.llm.ainvoke(messages)).content
+
+    async def _astream_llm(self, prompt, web_search):
+        if not web_search:
+            async for chunk in timed_aiter("llm.stream", self.llm.astream(prompt)):
+                for text in self._chunk_text(chunk):
+                    yield text
+            return
 
-            tool_messages = []
-            for tool_call in ai_msg.tool_calls:
-                tool_output = self.web_search_tool.invoke(tool_call["args"])
-                tool_messages.append(
-                    ToolMessage(content=str(tool_output), tool_call_id=tool_call["id"])
-                )
-                
-            print("tool_messages:", tool_messages)
+        # a tool-enabled step streams its text until the model starts calling a tool, text after that
+        # is held back and only sent if the calls come to nothing. what was sent stays part of the answer
+        llm_with_tools = self.llm.bind_tools([self.web_search_tool])
+        messages = prompt.to_messages()
+        for _ in range(TOOL_MAX_STEPS):
+            ai_msg, held = None, []
+            async for chunk in timed_aiter("llm.stream", llm_with_tools.astream(messages)):
+                ai_msg = chunk if ai_msg is None else ai_msg + chunk
+                if ai_msg.tool_call_chunks:
+                    held.extend(self._chunk_text(chunk))
+                    continue
+                for text in self._chunk_text(chunk):
+                    yield text
 
-            messages = prompt.to_messages()
+            if ai_msg is None or not ai_msg.tool_calls:
+                for text in held:
+                    yield text
+                return
             messages.append(ai_msg)
-            messages.extend(tool_messages)
-            
-            response = self.llm.invoke(messages)
-        else:
-            response = self.llm.invoke(prompt)
-            
-        return response.content
+            messages.extend(await self._arun_tool_calls(ai_msg))
+
+        async for chunk in timed_aiter("llm.stream", self.llm.astream(messages)):
+            for text in self._chunk_text(chunk):
+                yield text
+
+    async def _arun_tool_calls(self, ai_msg):
+        # the searches of one step are independent, run them side by side and answer in call order
+        calls, skipped = ai_msg.tool_calls[:TOOL_MAX_CALLS], ai_msg.tool_calls[TOOL_MAX_CALLS:]
+        args_by_key = {}
+        for tool_call in calls:
+            args_by_key.setdefault(self._search_key(tool_call["args"]), tool_call["args"])
+        results = await asyncio.gather(
+            *(self._asearch(key, args) for key, args in args_by_key.items()), return_exceptions=True)
+        outputs = {}
+        for key, result in zip(args_by_key, results):
+            if isinstance(result, Exception):
+                outputs[key] = self._search_failed(result)
+            elif isinstance(result, BaseException):
+                # a cancelled turn must stop here, not be answered as a search result
+                raise result
+            else:
+                outputs[key] = (result, "success")
+        tool_messages = self._tool_messages(calls, skipped, outputs)
+        logger.debug("tool messages: %s", tool_messages)
+        return tool_messages
+
+    async def _asearch(self, key, args):
+        cached = self._search_cache.get(key)
+        if cached is not None:
+            return cached
+        with span("tool_call"):
+            output = str(await self.web_search_tool.ainvoke(args))
+        self._search_cache.set(key, output)
+        return output
+
+    def _search_key(self, args):
+        # case, spacing and trailing punctuation do not change what a search returns, other options do
+        args = dict(args) if isinstance(args, dict) else {"query": str(args)}
+        query = re.sub(r"\s+", " ", str(args.pop("query", "")).lower()).strip(" ?!.,;:")
+        return (self.web_search_tool.name, query, json.dumps(args, sort_keys=True, default=str))
+
+    def _search_failed(self, error):
+        # a failed search is reported to the model instead of failing the whole turn, and never cached
+        logger.warning("Web search failed: %s", error)
+        return f"Search failed: {error}", "error"
+
+    def _tool_messages(self, calls, skipped, outputs):
+        tool_messages = []
+        for tool_call in calls:
+            content, status = outputs[self._search_key(tool_call["args"])]
+            tool_messages.append(ToolMessage(content=content, tool_call_id=tool_call["id"], status=status))
+        for tool_call in skipped:
+            # every call needs an answer, or the next model call is rejected
+            tool_messages.append(ToolMessage(
+                content=f"Skipped, at most {TOOL_MAX_CALLS} searches run per step", tool_call_id=tool_call["id"], status="error"))
+        return tool_messages
+
+    def _chunk_text(self, chunk):
+        content = chunk.content
+        if isinstance(content, str):
+            if content:
+                yield content
+            return
+        for part in content:
+            text = part if isinstance(part, str) else part.get("text", "")
+            if text:
+                yield text
  
     
 
@@ -0,0 +1,49 @@
+from fastapi import HTTPException
+from database.client import db_client
+from utils import parse_json, index_mindmap_nodes, LRUCache
+from metrics import span
+
+MINDMAP_CACHE_SIZE = 128
+
+class MindmapService:
+    def __init__(self, max_size=MINDMAP_CACHE_SIZE):
+        self.db_client = db_client
+        self._cache = LRUCache(max_size=max_size)
+
+    def get_mindmap(self, session_id):
+        entry = self._get_entry(session_id)
+        return entry["mindmap"] if entry else None
+
+    def get_node(self, session_id, node_id):
+        entry = self._get_entry(session_id)
+        if not entry:
+            raise HTTPException(status_code=404, detail="Mindmap not found")
+        node = entry["nodes"].get(int(node_id))
+        if not node:
+            raise HTTPException(status_code=404, detail="Node not found")
+        return node
+
+    def save_mindmap(self, session_id, mindmap_str):
+        self.db_client.insert_mindmap(session_id, mindmap_str)
+        self.invalidate(session_id)
+
+    def invalidate(self, session_id):
+        self._cache.pop(int(session_id))
+
+    def _get_entry(self, session_id):
+        key = int(session_id)
+        entry = self._cache.get(key)
+        if entry:
+            return entry
+
+        mindmap = self.db_client.get_mindmap(key)
+        if not mindmap:
+            return None
+        with span("mindmap.parse"):
+            mindmap_json = parse_json(mindmap["mindmap_json"])
+            entry = {"mindmap": mindmap_json, "nodes": index_mindmap_nodes(mindmap_json)}
+
+        self._cache.set(key, entry)
+        return entry
+
+mindmap_service = MindmapService()
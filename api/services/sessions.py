@@ -1,63 +1,164 @@
 from database.client import db_client
-from langchain_google_genai import GoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from fastapi import HTTPException
-from utils import validate_and_parse_mindmap, parse_json, get_yt_video_id
+from utils import validate_and_parse_mindmap, get_yt_video_id, index_mindmap_nodes, estimate_tokens, truncate_to_tokens, group_by_token_budget, lazy_property
+from llm import get_llm
 from services.docs import docs_service
 from services.sources import source_service
+from services.jobs import job_service, JobCancelled
+from services.mindmaps import mindmap_service
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from metrics import span, get_logger, with_context
+
+SOURCE_WORKERS = 4
+MINDMAP_TOKEN_BUDGET = 100_000  # larger corpora are summarized in groups first
+MINDMAP_GROUP_TOKENS = 25_000
+MINDMAP_MAP_WORKERS = 4
+MINDMAP_MAX_REDUCE_ROUNDS = 3  # merge rounds after the first outline pass
+SESSION_DELETE_TIMEOUT = 30  # seconds to wait for a cancelled ingestion to stop writing
+
+logger = get_logger("sessions")
 
 class SessionService:
     def __init__(self):
         self.db_client = db_client
         self.docs_service = docs_service
         self.source_service = source_service
-        self.llm = GoogleGenerativeAI(model="gemini-1.5-flash-8b")
+        self.job_service = job_service
+        self.mindmap_service = mindmap_service
+
+    @lazy_property
+    def llm(self):
+        return get_llm()
 
-    def get_sessions(self):
-        sessions = self.db_client.get_sessions()
+    def get_sessions(self, limit=None, cursor=None):
+        sessions = self.db_client.get_sessions(limit, cursor)
         return sessions
     
     def create_new_session(self, sources):
-        try:
-            session_id = self.db_client.insert_session()
-            for source in sources:
-                self.source_service.add_source(source, session_id)
-            mindmap_title, mindmap_str = self._generate_mindmap(session_id)
-            if mindmap_title and mindmap_str:
-                self.db_client.update_session_title(session_id, mindmap_title)
-                self.db_client.insert_mindmap(session_id, mindmap_str)
-            
-            return session_id
+        session_id = self.db_client.insert_session()
+        payload = [source.model_dump(mode="json") for source in sources]
+        job = self.job_service.submit(session_id, payload, self._ingest_sources)
+        return session_id, job["id"]
 
-        except Exception as e:
-            self.db_client.delete_session(session_id)
-            raise e
+    def get_session_status(self, session_id):
+        return self.job_service.get_session_job(session_id)
+
+    def cancel_session_job(self, session_id):
+        job = self.job_service.get_session_job(session_id)
+        return self.job_service.cancel(job["id"])
+
+    def retry_session_job(self, session_id):
+        job = self.job_service.get_session_job(session_id)
+        return self.job_service.retry(job["id"], self._ingest_sources)
     
     def delete_session(self, session_id):
+        job = self.db_client.get_latest_job(session_id)
+        if job and job["status"] in ("pending", "running"):
+            self.job_service.cancel(job["id"])
+            # the handler would keep writing sources and vectors for a session that is gone
+            if not self.job_service.wait(job["id"], SESSION_DELETE_TIMEOUT):
+                raise HTTPException(status_code=409, detail="Session is still ingesting, try again shortly")
         self.db_client.delete_session(session_id)
+        self.mindmap_service.invalidate(session_id)
+        # the sqlite cascade does not reach chroma, anything missed here is picked up by vectorstore.gc
+        try:
+            self.docs_service.delete_docs(session_id)
+        except Exception as e:
+            logger.error("Error deleting session vectors %s: %s", session_id, e)
     
     def get_full_session(self, session_id):
         session = self.db_client.get_session(session_id)
-        print("session",session)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        mindmap = self.db_client.get_mindmap(session_id)
-        mindmap_json = parse_json(mindmap["mindmap_json"]) if mindmap else None
+        mindmap_json = self.mindmap_service.get_mindmap(session_id)
         
         sources = self.source_service.get_sources(session_id)
+        job = self.db_client.get_latest_job(session_id)
         
         return {
             "session": {
                 **session,
                 "mindmap": mindmap_json,
-                "sources": sources
+                "sources": sources,
+                "status": job["status"] if job else "completed"
             }
         }
 
+    def _ingest_sources(self, session_id, sources, job):
+        # start from a clean slate so retried jobs do not duplicate sources or vectors
+        self.db_client.delete_sources(session_id)
+        self.docs_service.delete_docs(session_id)
+
+        job.start_stage("sources", total=len(sources))
+        with span("ingest.sources"):
+            failures = self._add_sources_concurrently(sources, session_id, job)
+        if sources and len(failures) == len(sources):
+            raise ValueError(f"All sources failed to load: {failures[0]['error']}")
+
+        job.start_stage("mindmap", total=1)
+        with span("ingest.mindmap"):
+            mindmap_title, mindmap_str = self._generate_mindmap(session_id)
+        job.check_cancelled()
+        if mindmap_title and mindmap_str:
+            self.db_client.update_session_title(session_id, mindmap_title)
+            self.mindmap_service.save_mindmap(session_id, mindmap_str)
+        job.advance("mindmap")
+
+        with span("ingest.retrieval_warmup"):
+            self._warm_node_retrieval(session_id, job)
+
+    def _add_sources_concurrently(self, sources, session_id, job):
+        def add_source(source):
+            job.check_cancelled()
+            self.source_service.add_source(SimpleNamespace(**source), session_id)
+
+        failures = []
+        with ThreadPoolExecutor(max_workers=max(1, min(SOURCE_WORKERS, len(sources))), thread_name_prefix="source") as executor:
+            futures = {executor.submit(with_context(add_source), source): source for source in sources}
+            for future in as_completed(futures):
+                source = futures[future]
+                try:
+                    future.result()
+                    job.advance("sources")
+                except JobCancelled:
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    raise
+                except Exception as e:
+                    # one broken link should not take the whole session down with it
+                    logger.warning("Error adding source %s: %s", source["url"], e)
+                    failures.append({"url": source["url"], "error": str(e)})
+                    job.fail_item("sources", source["url"], str(e))
+        return failures
+
+    def _warm_node_retrieval(self, session_id, job):
+        mindmap = self.mindmap_service.get_mindmap(session_id)
+        if not mindmap:
+            return
+        nodes = list(index_mindmap_nodes(mindmap).values())
+        # the session is complete once the mindmap is saved, a cancel now only cuts the warm-up short
+        job.start_stage("retrieval", total=len(nodes), cancellable=False)
+
+        def warm(node):
+            if job.cancel_event.is_set():
+                return
+            try:
+                self.docs_service.query_node_docs(node, session_id)
+            except Exception as e:
+                # chats fall back to a live query, so a miss here is harmless
+                logger.warning("Error warming retrieval for node %s: %s", node.get("node_id"), e)
+            job.advance("retrieval")
+
+        with ThreadPoolExecutor(max_workers=SOURCE_WORKERS, thread_name_prefix="retrieval") as executor:
+            list(executor.map(with_context(warm), nodes))
+
     def _generate_mindmap(self, session_id):
         docs = self.docs_service.get_all_docs(session_id)
         docs_str = "\n".join([doc for doc in docs])
+        if estimate_tokens(docs_str) > MINDMAP_TOKEN_BUDGET:
+            docs_str = self._summarize_docs(docs)
         mindmap_schema = """{
             "title": "Mindmap Title",
             "description": "Mindmap Description",
@@ -91,4 +192,48 @@ class SessionService:
         
         return mindmap_title, mindmap_str
 
+    def _summarize_docs(self, docs):
+        # map: outline groups of chunks in parallel, reduce: merge groups of outlines until they fit
+        texts = self._map_groups(self._outline_group, docs)
+        rounds = 0
+        while len(texts) > 1 and rounds < MINDMAP_MAX_REDUCE_ROUNDS and estimate_tokens("\n\n".join(texts)) > MINDMAP_TOKEN_BUDGET:
+            texts = self._map_groups(self._merge_outlines, texts)
+            rounds += 1
+
+        outlines = "\n\n".join(texts)
+        if estimate_tokens(outlines) > MINDMAP_TOKEN_BUDGET:
+            logger.warning("Mindmap input is ~%d tokens after %d merge rounds, truncating to %d",
+                           estimate_tokens(outlines), rounds, MINDMAP_TOKEN_BUDGET)
+            outlines = truncate_to_tokens(outlines, MINDMAP_TOKEN_BUDGET)
+        return outlines
+
+    def _map_groups(self, fn, texts):
+        groups = group_by_token_budget(texts, MINDMAP_GROUP_TOKENS)
+        with ThreadPoolExecutor(max_workers=MINDMAP_MAP_WORKERS, thread_name_prefix="mindmap") as executor:
+            return list(executor.map(with_context(fn), groups))
+
+    def _outline_group(self, texts):
+        prompt_template = ChatPromptTemplate([
+            ("system", """
+             You are a helpful assistant that condenses part of a long document into an outline. The outline will later be merged with outlines of the other parts into a mindmap.
+             List the main subjects of the text as a nested bullet outline. Give every subject a one-line description. Keep only what is in the text and do not generate any other text.
+             """),
+            ("user",
+             "Outline the following part of the document: {docs_str}")
+        ])
+        prompt = prompt_template.invoke({"docs_str": "\n".join(texts)})
+        return self.llm.invoke(prompt)
+
+    def _merge_outlines(self, outlines):
+        prompt_template = ChatPromptTemplate([
+            ("system", """
+             You are a helpful assistant that merges outlines of consecutive parts of one long document into a single outline. The result will be turned into a mindmap.
+             Combine subjects that appear in several outlines, keep the nesting and the one-line descriptions, and drop repetition. Keep only what is in the outlines and do not generate any other text.
+             """),
+            ("user",
+             "Merge the following outlines: {outlines}")
+        ])
+        prompt = prompt_template.invoke({"outlines": "\n\n".join(outlines)})
+        return self.llm.invoke(prompt)
+
 session_service = SessionService()
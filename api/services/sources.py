@@ -1,5 +1,5 @@
 from database.client import db_client
-from utils import get_yt_title
+from http_client import get_yt_title
 from services.docs import docs_service
 
 class SourceService:
@@ -14,7 +14,16 @@ class SourceService:
             source.title = source.url.split("//")[-1]
         
         source_id = self.db_client.insert_source(source.title, source.type, source.url, session_id)
-        self.docs_service.add_docs(source.url, source.type, session_id, source_id)
+        try:
+            self.docs_service.add_docs(source.url, source.type, session_id, source_id)
+        except Exception:
+            # a source that failed halfway should not leave its row or partial vectors behind
+            self.delete_source(session_id, source_id)
+            raise
+
+    def delete_source(self, session_id, source_id):
+        self.db_client.delete_source(source_id)
+        self.docs_service.delete_source_docs(session_id, source_id)
 
     def get_sources(self, session_id):
         sources = self.db_client.get_sources(session_id)
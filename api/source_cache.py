@@ -0,0 +1,64 @@
+import json
+import time
+import zlib
+from pathlib import Path
+from database.cache import SqliteCache
+
+SOURCE_CACHE_PATH = Path(__file__).parent / ".sqlite" / "sources.db"
+SOURCE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+SOURCE_CACHE_POOL_SIZE = 4
+# chunk text kept per source, anything larger is parsed again instead of held in memory for the cache
+SOURCE_CACHE_MAX_ENTRY_BYTES = 16 * 1024 * 1024
+# uploaded pdfs are content addressed and never go stale, pages and transcripts can change
+SOURCE_CACHE_TTL = {
+    "youtube": 30 * 24 * 60 * 60,
+    "web_page": 24 * 60 * 60,
+    "pdf": None,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS parsed_sources (
+    key TEXT NOT NULL,
+    chunker TEXT NOT NULL,
+    chunks BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (key, chunker)
+);
+CREATE INDEX IF NOT EXISTS idx_parsed_sources_last_used ON parsed_sources (last_used);
+"""
+
+
+class SourceCache(SqliteCache):
+    table = "parsed_sources"
+    key_columns = ("key", "chunker")
+    schema = SCHEMA
+    # expired entries go first, then least recently used
+    evict_order = "expires_at IS NULL, expires_at > :now, last_used ASC"
+
+    def __init__(self, path=SOURCE_CACHE_PATH, max_bytes=SOURCE_CACHE_MAX_BYTES):
+        super().__init__(path, max_bytes, pool_size=SOURCE_CACHE_POOL_SIZE)
+
+    def get(self, key, chunker):
+        now = time.time()
+        with self.connection() as conn:
+            row = conn.execute("SELECT * FROM parsed_sources WHERE key = ? AND chunker = ?", (key, chunker)).fetchone()
+            if row is None:
+                return None
+            expired = row["expires_at"] is not None and row["expires_at"] <= now
+            if not expired:
+                conn.execute("UPDATE parsed_sources SET last_used = ? WHERE key = ? AND chunker = ?", (now, key, chunker))
+                conn.commit()
+        if expired:
+            self._delete_row((key, chunker), row["size"])
+            return None
+        return [tuple(chunk) for chunk in json.loads(zlib.decompress(row["chunks"]))]
+
+    def put(self, key, chunker, chunks, ttl=None):
+        blob = zlib.compress(json.dumps(chunks).encode("utf-8"))
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        self._put_rows([{
+            "key": key, "chunker": chunker, "chunks": blob, "size": len(blob), "expires_at": expires_at, "last_used": now,
+        }])
@@ -0,0 +1,11 @@
+import pytest
+
+from database.client import DatabaseClient
+
+
+@pytest.fixture
+def db(tmp_path):
+    client = DatabaseClient(db_path=tmp_path / "test.db")
+    client.init_database()
+    yield client
+    client.close()
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import httpx
+import pytest
+
+import llm
+import main
+from dependencies import get_session_service
+from vectorstore import client as vectorstore
+from vectorstore.cache import CachedEmbeddings, EmbeddingCache
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+
+class FakeSessionService:
+    def get_sessions(self, limit=None, cursor=None):
+        return [{"id": 3}, {"id": 2}][:limit]
+
+
+class FakeJobService:
+    def __init__(self):
+        self.calls = []
+
+    def start(self):
+        self.calls.append("start")
+
+    def shutdown(self):
+        self.calls.append("shutdown")
+
+
+class FakeDatabaseClient:
+    def __init__(self):
+        self.calls = []
+
+    def init_database(self):
+        self.calls.append("init")
+
+    def close(self):
+        self.calls.append("close")
+
+
+def test_importing_the_app_builds_no_clients():
+    env = {key: value for key, value in os.environ.items() if key not in ("GOOGLE_API_KEY", "TAVILY_API_KEY")}
+    code = (
+        "import main\n"
+        "from vectorstore.client import vectorstore_client\n"
+        "from services.messages import message_service\n"
+        "from llm import get_llm\n"
+        "assert 'client' not in vectorstore_client.__dict__\n"
+        "assert 'llm' not in message_service.__dict__\n"
+        "assert get_llm.cache_info().currsize == 0\n"
+        "assert not main.db_client._initialized\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=API_DIR, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path):
+    # a real client on temp paths, the lifespan builds its embeddings
+    cache = EmbeddingCache(path=tmp_path / "embeddings.db")
+    monkeypatch.setattr(vectorstore, "CachedEmbeddings", lambda embeddings, model: CachedEmbeddings(embeddings, model, cache=cache))
+    client = vectorstore.VectoreStoreClient()
+    client.vectorstore_path = tmp_path / "chroma"
+    monkeypatch.setattr(main, "vectorstore_client", client)
+    yield client
+    cache.close()
+
+
+def test_lifespan_initializes_and_shuts_down(monkeypatch, store):
+    db, jobs = FakeDatabaseClient(), FakeJobService()
+    monkeypatch.setattr(main, "db_client", db)
+    monkeypatch.setattr(main, "job_service", jobs)
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+
+    async def run():
+        async with main.lifespan(main.app):
+            assert db.calls == ["init"] and jobs.calls == ["start"]
+
+    asyncio.run(run())
+
+    assert db.calls == ["init", "close"]
+    assert jobs.calls == ["start", "shutdown"]
+
+
+def test_embeddings_built_at_startup_work_on_worker_threads(monkeypatch, store):
+    monkeypatch.setattr(main, "db_client", FakeDatabaseClient())
+    monkeypatch.setattr(main, "job_service", FakeJobService())
+    monkeypatch.setattr(llm, "LLM_BACKEND", "google")
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    llm.get_embeddings.cache_clear()
+    errors = []
+
+    def open_store():
+        # ingestion opens collections on its own threads, which have no event loop
+        try:
+            store._get_store(1)
+        except Exception as e:
+            errors.append(e)
+
+    async def run():
+        async with main.lifespan(main.app):
+            thread = threading.Thread(target=open_store, name="embedding_0")
+            thread.start()
+            thread.join()
+
+    try:
+        asyncio.run(run())
+    finally:
+        llm.get_embeddings.cache_clear()
+
+    assert errors == []
+    assert type(store.embeddings.embeddings).__name__ == "GoogleGenerativeAIEmbeddings"
+
+
+def test_routes_take_services_from_dependencies():
+    main.app.dependency_overrides[get_session_service] = FakeSessionService
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/sessions/", params={"limit": 2})
+
+    try:
+        response = asyncio.run(run())
+    finally:
+        main.app.dependency_overrides.clear()
+
+    assert response.json() == [{"id": 3}, {"id": 2}]
+    assert response.headers["X-Next-Cursor"] == "2"
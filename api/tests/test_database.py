@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from database.client import ConnectionPool
+
+
+def test_connection_uses_wal_and_pragmas(db):
+    with db.get_connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+
+def test_connections_are_reused(db):
+    with db.get_connection() as first:
+        pass
+    with db.get_connection() as second:
+        pass
+    assert first is second
+
+
+def test_exhausted_pool_times_out_instead_of_hanging(tmp_path):
+    pool = ConnectionPool(tmp_path / "pool.db", size=1)
+    held = pool.acquire()
+    with pytest.raises(TimeoutError, match="all 1 are in use"):
+        pool.acquire(timeout=0.05)
+    pool.release(held)
+    assert pool.acquire(timeout=0.05) is held
+    pool.close()
+
+
+def test_uncommitted_work_is_rolled_back_on_release(db):
+    session_id = db.insert_session()
+    with db.get_connection() as conn:
+        conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+    assert db.get_session(session_id) is not None
+
+
+def test_concurrent_writes_across_threads(db):
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        ids = list(executor.map(lambda _: db.insert_session(), range(200)))
+    assert len(set(ids)) == 200
+    assert len(db.get_sessions()) == 200
+
+
+def test_keyset_pagination_of_sessions(db):
+    ids = [db.insert_session() for _ in range(5)]
+
+    first = db.get_sessions(limit=2)
+    second = db.get_sessions(limit=2, before_id=first[-1]["id"])
+    third = db.get_sessions(limit=2, before_id=second[-1]["id"])
+
+    assert [row["id"] for row in first + second + third] == ids[::-1]
+
+
+def test_message_pages_walk_backwards_in_ascending_order(db):
+    chat = db.insert_chat(db.insert_session(), 1, "normal")
+    ids = [db.insert_message(chat["id"], "user", str(i))["id"] for i in range(5)]
+
+    latest = db.get_messages(chat["id"], desc=False, limit=2)
+    older = db.get_messages(chat["id"], desc=False, limit=2, before_id=latest[0]["id"])
+
+    assert [row["id"] for row in latest] == ids[3:]
+    assert [row["id"] for row in older] == ids[1:3]
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from fakes import FakeChatModel, FakeSearchTool
+from services import messages
+from services.messages import MessageService
+
+queries = []
+in_flight = {"now": 0, "peak": 0}
+
+
+class CountingSearchTool(FakeSearchTool):
+    async def _arun(self, query, **kwargs):
+        queries.append(query)
+        if query == "broken":
+            raise RuntimeError("search is down")
+        if query == "cancelled":
+            raise asyncio.CancelledError()
+        in_flight["now"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        try:
+            # searches started side by side are all in flight before any of them resumes
+            await asyncio.sleep(0)
+            return await super()._arun(query, **kwargs)
+        finally:
+            in_flight["now"] -= 1
+
+
+@pytest.fixture
+def service():
+    queries.clear()
+    in_flight.update(now=0, peak=0)
+    service = MessageService()
+    service.llm = FakeChatModel(tool_calls_per_step=3)
+    service.web_search_tool = CountingSearchTool()
+    return service
+
+
+def deepdive(service, content):
+    return asyncio.run(service._ainvoke_llm(content, "deepdive", "Go", {}, "docs", [], web_search=True))
+
+
+def run_tool_calls(service, content):
+    ai_msg = service.llm.bind_tools([service.web_search_tool]).invoke(content)
+    return ai_msg, asyncio.run(service._arun_tool_calls(ai_msg))
+
+
+def test_searches_of_one_step_run_concurrently(service):
+    answer = deepdive(service, "go channels")
+
+    assert answer.startswith("About go channels")
+    assert sorted(queries) == ["go channels", "go channels latest", "go channels overview"]
+    assert in_flight["peak"] == 3
+
+
+def test_cancelled_search_cancels_the_turn(service):
+    with pytest.raises(asyncio.CancelledError):
+        run_tool_calls(service, "cancelled")
+
+
+def test_repeated_searches_are_served_from_the_cache(service):
+    deepdive(service, " Go  CHANNELS ")
+    deepdive(service, "go channels")
+
+    assert len(queries) == 3
+    assert service._search_cache.hits == 3
+
+
+def test_duplicate_calls_in_one_step_search_once(service):
+    service.llm = FakeChatModel(tool_calls_per_step=6)
+    ai_msg, tool_messages = run_tool_calls(service, "go")
+
+    # the fake cycles five suffixes, so the sixth call repeats the first query
+    assert len(queries) == 5
+    assert [message.tool_call_id for message in tool_messages] == [call["id"] for call in ai_msg.tool_calls]
+
+
+def test_tool_steps_are_bounded(service, monkeypatch):
+    monkeypatch.setattr(messages, "TOOL_MAX_STEPS", 2)
+    service.llm = FakeChatModel(tool_calls_per_step=1, tool_rounds=10)
+    calls = []
+    original = FakeChatModel._respond
+    monkeypatch.setattr(FakeChatModel, "_respond", lambda self, msgs: calls.append(self.tool_names) or original(self, msgs))
+
+    answer = deepdive(service, "go channels")
+
+    # two tool-enabled steps, then one forced answer without tools
+    assert calls == [["tavily_search"], ["tavily_search"], []]
+    assert answer.startswith("About go channels")
+
+
+def test_failed_search_is_reported_and_not_cached(service, monkeypatch):
+    monkeypatch.setattr(messages, "TOOL_MAX_CALLS", 1)
+    _, tool_messages = run_tool_calls(service, "broken")
+
+    assert tool_messages[0].status == "error" and "search is down" in tool_messages[0].content
+    assert [message.status for message in tool_messages[1:]] == ["error", "error"]
+    assert "Skipped" in tool_messages[1].content
+    assert len(service._search_cache) == 0
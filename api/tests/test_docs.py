@@ -0,0 +1,48 @@
+import re
+
+from services import docs
+
+
+def write_pdf(path, pages):
+    # smallest pdf pypdf reads back: one helvetica text line per page
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 10 Tf 20 800 Td ({text}) Tj ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>"
+
+    out = "%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    path.write_text(out)
+
+
+def test_pdf_chunks_cover_every_page_and_keep_page_numbers(tmp_path, monkeypatch):
+    # ~1800 characters a page, so chunks of 1000 regularly straddle a page break
+    pages = [" ".join(f"p{page}w{word}" for word in range(300)) for page in range(1, 4)]
+    write_pdf(tmp_path / "doc.pdf", pages)
+    monkeypatch.chdir(tmp_path)
+    service = docs.DocsService()
+
+    # uploads are passed as /files/<name>, relative to the working directory
+    chunks = list(service._pages_to_docs(service._iter_pdf_pages("/doc.pdf"), session_id=1, source_id=10))
+
+    words = [set(re.findall(r"p\d+w\d+", chunk.page_content)) for chunk in chunks]
+    assert set().union(*words) == {word for text in pages for word in text.split()}
+    for chunk in chunks:
+        # a chunk is attributed to the page it starts on
+        first = re.search(r"p(\d+)w\d+", chunk.page_content)
+        assert chunk.metadata == {"session_id": 1, "source_id": 10, "page": int(first.group(1))}
+        assert len(chunk.page_content) <= docs.CHUNK_SIZE
+    assert any({word.split("w")[0] for word in chunk_words} == {"p1", "p2"} for chunk_words in words)
+    assert any({word.split("w")[0] for word in chunk_words} == {"p2", "p3"} for chunk_words in words)
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from vectorstore.cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 1.0, 2.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(path=tmp_path / "embeddings.db")
+    yield cache
+    cache.close()
+
+
+def test_cached_chunks_skip_the_embedding_call(cache):
+    backend = CountingEmbeddings()
+    embeddings = CachedEmbeddings(backend, model="test-model", cache=cache)
+
+    first = embeddings.embed_documents(["alpha", "beta", "alpha"])
+    second = embeddings.embed_documents(["beta", "gamma"])
+
+    assert backend.embedded == ["alpha", "beta", "gamma"]
+    assert first == [[5.0, 1.0, 2.0], [4.0, 1.0, 2.0], [5.0, 1.0, 2.0]]
+    assert second[0] == first[1]
+
+
+def test_cache_is_keyed_by_model(cache):
+    backend = CountingEmbeddings()
+    CachedEmbeddings(backend, model="a", cache=cache).embed_documents(["text"])
+    CachedEmbeddings(backend, model="b", cache=cache).embed_documents(["text"])
+    assert backend.embedded == ["text", "text"]
+
+
+def test_cache_persists_and_evicts_by_size(tmp_path):
+    path = tmp_path / "embeddings.db"
+    entry_size = 3 * 4  # three float32 values
+    cache = EmbeddingCache(path=path, max_bytes=entry_size * 2)
+    cache.put_many("m", {"a": [1.0, 1.0, 1.0]})
+    cache.put_many("m", {"b": [2.0, 2.0, 2.0]})
+    cache.put_many("m", {"c": [3.0, 3.0, 3.0]})
+    cache.close()
+
+    reopened = EmbeddingCache(path=path, max_bytes=entry_size * 2)
+    assert set(reopened.get_many("m", ["a", "b", "c"])) == {"c"}
+    reopened.close()
+
+
+def test_query_embeddings_are_cached_in_memory_and_on_disk(cache):
+    backend = CountingEmbeddings()
+    embeddings = CachedEmbeddings(backend, model="m", cache=cache)
+
+    assert embeddings.embed_query("node title") == embeddings.embed_query("node title")
+    assert backend.embedded == ["node title"]
+
+    restarted = CachedEmbeddings(backend, model="m", cache=cache)
+    restarted.embed_query("node title")
+    restarted.embed_query("node title")
+
+    assert backend.embedded == ["node title"]
+    assert embeddings.query_stats == {"memory_hits": 1, "disk_hits": 0, "misses": 1}
+    assert restarted.query_stats == {"memory_hits": 1, "disk_hits": 1, "misses": 0}
+
+
+def test_queries_and_documents_do_not_share_entries(cache):
+    backend = CountingEmbeddings()
+    embeddings = CachedEmbeddings(backend, model="m", cache=cache)
+
+    embeddings.embed_documents(["same text"])
+    embeddings.embed_query("same text")
+
+    assert backend.embedded == ["same text", "same text"]
+
+
+def test_async_query_embeddings_use_the_same_cache(cache):
+    backend = CountingEmbeddings()
+    embeddings = CachedEmbeddings(backend, model="m", cache=cache, query_cache_size=1)
+
+    async def run():
+        await embeddings.aembed_query("first")
+        await embeddings.aembed_query("second")  # pushes "first" out of memory
+        await embeddings.aembed_query("first")
+        await embeddings.aembed_query("first")
+
+    asyncio.run(run())
+
+    assert backend.embedded == ["first", "second"]
+    assert embeddings.query_stats == {"memory_hits": 1, "disk_hits": 1, "misses": 2}
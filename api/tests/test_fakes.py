@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+from langchain_core.messages import HumanMessage, ToolMessage
+
+from fakes import FakeChatModel, FakeEmbeddings, FakeLLM, FakeSearchTool
+from utils import validate_and_parse_mindmap
+
+
+def test_chat_model_asks_for_searches_only_when_tools_are_bound():
+    model = FakeChatModel(tool_calls_per_step=2)
+    tool = FakeSearchTool()
+    messages = [HumanMessage(content="how do goroutines work")]
+
+    assert model.invoke(messages).content.startswith("About how do goroutines work")
+
+    ai_msg = model.bind_tools([tool]).invoke(messages)
+    assert [call["args"]["query"] for call in ai_msg.tool_calls] == ["how do goroutines work", "how do goroutines work overview"]
+
+    followup = messages + [ai_msg] + [
+        ToolMessage(content=json.dumps(tool.invoke(call["args"])), tool_call_id=call["id"]) for call in ai_msg.tool_calls
+    ]
+    assert not model.bind_tools([tool]).invoke(followup).tool_calls
+
+
+def test_chat_model_streams_tool_calls():
+    model = FakeChatModel().bind_tools([FakeSearchTool()])
+
+    async def collect():
+        message = None
+        async for chunk in model.astream([HumanMessage(content="latest news")]):
+            message = chunk if message is None else message + chunk
+        return message
+
+    assert asyncio.run(collect()).tool_calls[0]["args"] == {"query": "latest news"}
+
+
+def test_llm_mindmap_is_valid_and_built_from_the_document():
+    document = "channels goroutines channels scheduler runtime channels goroutines memory"
+    response = FakeLLM().invoke(f"Generate a mindmap about the following document: {document}")
+
+    title, mindmap_str = validate_and_parse_mindmap(response)
+    assert title == "Channels Goroutines"
+    assert [child["title"] for child in json.loads(mindmap_str)["children"]][:2] == ["Channels", "Goroutines"]
+
+
+def test_embeddings_are_deterministic_and_word_based():
+    embeddings = FakeEmbeddings(size=64)
+    first, second, unrelated = embeddings.embed_documents(["golang channels", "channels golang", "python decorators"])
+
+    assert first == second == embeddings.embed_query("golang channels")
+    assert sum(a * b for a, b in zip(first, unrelated)) < 0.5
@@ -0,0 +1,74 @@
+import asyncio
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import Headers
+
+from services import files
+from services.files import FilesService
+
+PDF = b"%PDF-1.4 not much of a document"
+
+
+@pytest.fixture
+def service(db, tmp_path):
+    service = FilesService()
+    service.files_dir = tmp_path / "files"
+    service.files_dir.mkdir()
+    service.db_client = db
+    return service
+
+
+def upload(data, filename="doc.pdf", size=None):
+    return UploadFile(io.BytesIO(data), filename=filename, size=size, headers=Headers({"content-type": "application/pdf"}))
+
+
+def stored_files(service):
+    return sorted(path.name for path in service.files_dir.iterdir())
+
+
+def test_same_bytes_are_stored_once(service, db):
+    first = asyncio.run(service.upload_file(upload(PDF, "a.pdf")))
+    second = asyncio.run(service.upload_file(upload(PDF, "b.pdf")))
+
+    assert first == second
+    assert len(stored_files(service)) == 1
+    assert [row["original_filename"] for row in db.get_all_files()] == ["a.pdf"]
+
+
+def test_concurrent_uploads_of_the_same_bytes_share_one_row(service, db):
+    async def upload_twice():
+        return await asyncio.gather(service.upload_file(upload(PDF)), service.upload_file(upload(PDF)))
+
+    first, second = asyncio.run(upload_twice())
+
+    assert first == second
+    assert len(db.get_all_files()) == 1
+    assert len(stored_files(service)) == 1
+
+
+@pytest.mark.parametrize("declared_size", [None, 11])
+def test_uploads_over_the_limit_are_rejected_and_cleaned_up(service, db, monkeypatch, declared_size):
+    # without a declared size the limit is only hit while streaming
+    monkeypatch.setattr(files, "UPLOAD_MAX_BYTES", 10)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(service.upload_file(upload(PDF, size=declared_size)))
+
+    assert error.value.status_code == 413
+    assert stored_files(service) == []
+    assert db.get_all_files() == []
+
+
+def test_failed_upload_leaves_no_temp_file(service, monkeypatch):
+    def broken_insert(*args):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(service.db_client, "insert_file", broken_insert)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(service.upload_file(upload(PDF)))
+
+    assert error.value.status_code == 500
+    assert not [name for name in stored_files(service) if name.startswith(".upload-")]
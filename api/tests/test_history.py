@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services import history
+
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return SimpleNamespace(content=f"summary #{len(self.prompts)}")
+
+
+@pytest.fixture
+def history_service(db, monkeypatch):
+    monkeypatch.setattr(history, "db_client", db)
+    monkeypatch.setattr(history, "HISTORY_TOKEN_BUDGET", 100)
+    return history.HistoryService(FakeLLM())
+
+
+def add_turns(db, chat_id, count):
+    for i in range(count):
+        db.insert_message(chat_id, "user", f"question {i} " + "x" * 80)
+        db.insert_message(chat_id, "assistant", f"answer {i} " + "y" * 80)
+
+
+def test_history_is_windowed_to_the_token_budget(db, history_service):
+    chat = db.insert_chat(db.insert_session(), 1, "normal")
+    add_turns(db, chat["id"], 10)
+
+    window = history_service.get_history(chat["id"])
+
+    assert [message["content"].split(" x")[0].split(" y")[0] for message in window] == [
+        "question 8", "answer 8", "question 9", "answer 9"
+    ]
+
+
+def test_overflow_is_folded_into_a_stored_summary(db, history_service):
+    chat = db.insert_chat(db.insert_session(), 1, "normal")
+    add_turns(db, chat["id"], 10)
+
+    history_service.schedule_compaction(chat["id"])
+    history_service.executor.submit(lambda: None).result(timeout=5)
+
+    summary = db.get_chat_summary(chat["id"])
+    assert summary["summary"] == "summary #1"
+    assert "question 0" in history_service.llm.prompts[0].to_string()
+
+    window = history_service.get_history(chat["id"])
+    assert window[0] == {"role": "system", "content": "Summary of the earlier conversation: summary #1"}
+    assert window[1]["id"] == summary["last_message_id"] + 1
@@ -0,0 +1,121 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_client import HttpClient, ResponseCache
+
+PAGE = b"<html><head><title>Stub &amp; Page</title></head><body><p>hello</p></body></html>"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        StubHandler.requests.append((self.path, dict(self.headers)))
+        if self.path == "/etag":
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self._send(PAGE, {"ETag": '"v1"'})
+        elif self.path == "/last-modified":
+            if self.headers.get("If-Modified-Since") == "Wed, 01 Jan 2025 00:00:00 GMT":
+                self.send_response(304)
+                self.end_headers()
+                return
+            self._send(PAGE, {"Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"})
+        elif self.path == "/plain":
+            self._send(PAGE, {})
+        elif self.path == "/slow-title":
+            # the title arrives right away, the rest of the page takes far longer than the test allows
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(PAGE) + 10_000_000))
+            self.end_headers()
+            self.wfile.write(PAGE)
+            self.wfile.flush()
+            try:
+                for _ in range(100):
+                    time.sleep(0.1)
+                    self.wfile.write(b" " * 100_000)
+            except OSError:
+                pass
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def _send(self, body, headers):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def client(tmp_path):
+    StubHandler.requests = []
+    cache = ResponseCache(path=tmp_path / "http_cache.db")
+    yield HttpClient(cache=cache)
+    cache.close()
+
+
+@pytest.mark.parametrize("path", ["/etag", "/last-modified"])
+def test_revalidated_pages_are_served_from_the_cache(server, client, path):
+    assert client.get_text(server + path) == PAGE.decode()
+    assert client.get_text(server + path) == PAGE.decode()
+
+    assert len(StubHandler.requests) == 2
+    conditional = StubHandler.requests[1][1]
+    assert "If-None-Match" in conditional or "If-Modified-Since" in conditional
+
+
+def test_pages_without_validators_are_not_cached(server, client):
+    client.get_text(server + "/plain")
+
+    assert client.cache.get(server + "/plain") is None
+
+
+def test_errors_are_raised(server, client):
+    with pytest.raises(Exception):
+        client.get_text(server + "/missing")
+
+
+def test_title_is_read_without_downloading_the_page(server, client):
+    start = time.monotonic()
+    title = client.get_title(server + "/slow-title")
+
+    assert title == "Stub & Page"
+    assert time.monotonic() - start < 2
+
+    client.get_title(server + "/slow-title")
+    assert len(StubHandler.requests) == 1
+
+
+def test_cache_evicts_least_recently_used_pages(tmp_path):
+    cache = ResponseCache(path=tmp_path / "http_cache.db", max_bytes=25)
+    cache.put("a", '"a"', None, "utf-8", b"x" * 10)
+    cache.put("b", '"b"', None, "utf-8", b"x" * 10)
+    cache.get("a")
+    cache.put("c", '"c"', None, "utf-8", b"x" * 10)
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    cache.close()
@@ -0,0 +1,151 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from metrics import request_id_var
+from services import jobs
+
+
+@pytest.fixture
+def job_service(db, monkeypatch):
+    monkeypatch.setattr(jobs, "db_client", db)
+    monkeypatch.setattr(jobs, "JOB_RETRY_BACKOFF", 0)
+    service = jobs.JobService()
+    yield service
+    service.executor.shutdown(wait=True)
+
+
+def wait_for(job_service, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = job_service.get_job(job_id)
+        if job["status"] in jobs.FINISHED_STATUSES:
+            return job
+        time.sleep(0.01)
+    raise TimeoutError(f"job {job_id} did not finish")
+
+
+def test_job_reports_stage_progress(db, job_service):
+    def handler(session_id, payload, job):
+        job.start_stage("sources", total=len(payload))
+        for _ in payload:
+            job.advance("sources")
+
+    session_id = db.insert_session()
+    job = job_service.submit(session_id, ["a", "b"], handler)
+    job = wait_for(job_service, job["id"])
+
+    assert job["status"] == "completed"
+    assert job["progress"] == {"sources": {"done": 2, "total": 2}}
+
+
+def test_jobs_keep_the_request_id_of_their_submitter(db, job_service):
+    seen = []
+
+    def handler(session_id, payload, job):
+        seen.append(request_id_var.get())
+
+    session_id = db.insert_session()
+    token = request_id_var.set("req-1")
+    try:
+        job = job_service.submit(session_id, [], handler)
+    finally:
+        request_id_var.reset(token)
+    wait_for(job_service, job["id"])
+
+    assert seen == ["req-1"]
+
+
+def test_failed_job_is_retried_then_marked_failed(db, job_service):
+    calls = []
+
+    def handler(session_id, payload, job):
+        calls.append(1)
+        raise RuntimeError("boom")
+
+    session_id = db.insert_session()
+    job = job_service.submit(session_id, [], handler)
+    job = wait_for(job_service, job["id"])
+
+    assert job["status"] == "failed"
+    assert job["error"] == "boom"
+    assert len(calls) == jobs.JOB_MAX_ATTEMPTS
+
+    job_service.retry(job["id"], lambda *args: None)
+    assert wait_for(job_service, job["id"])["status"] == "completed"
+
+
+def test_running_job_can_be_cancelled(db, job_service):
+    started = threading.Event()
+
+    def handler(session_id, payload, job):
+        job.start_stage("sources", total=1)
+        started.set()
+        job.cancel_event.wait(5)
+        job.check_cancelled()
+
+    session_id = db.insert_session()
+    job = job_service.submit(session_id, [], handler)
+    started.wait(5)
+    job_service.cancel(job["id"])
+
+    assert wait_for(job_service, job["id"])["status"] == "cancelled"
+
+
+def test_cancelled_pending_job_is_not_queued_twice(db, job_service):
+    release = threading.Event()
+    job_service.executor.shutdown(wait=True)
+    job_service.executor = jobs.ThreadPoolExecutor(max_workers=1)
+
+    blocker = job_service.submit(db.insert_session(), [], lambda *args: release.wait(5))
+    pending = job_service.submit(db.insert_session(), [], lambda *args: None)
+    job_service.cancel(pending["id"])
+
+    # its first attempt is still queued behind the blocker
+    with pytest.raises(HTTPException) as error:
+        job_service.retry(pending["id"], lambda *args: None)
+    assert error.value.status_code == 409
+
+    release.set()
+    assert job_service.wait(pending["id"], 5)
+    assert wait_for(job_service, blocker["id"])["status"] == "completed"
+    assert job_service.get_job(pending["id"])["status"] == "cancelled"
+
+    job_service.retry(pending["id"], lambda *args: None)
+    assert wait_for(job_service, pending["id"])["status"] == "completed"
+    assert job_service._runs == {}
+
+
+def test_deleting_a_session_waits_for_its_job_to_stop(db, job_service):
+    from services.sessions import SessionService
+
+    writes = []
+    started = threading.Event()
+
+    def handler(session_id, payload, job):
+        job.start_stage("sources", total=100)
+        started.set()
+        for _ in range(100):
+            time.sleep(0.01)
+            job.check_cancelled()
+            db.insert_source("page", "web_page", "http://example.com", session_id)
+            writes.append(1)
+
+    sessions = SessionService()
+    sessions.db_client = db
+    sessions.job_service = job_service
+    sessions.docs_service = SimpleNamespace(delete_docs=lambda session_id: None)
+
+    session_id = db.insert_session()
+    job = job_service.submit(session_id, [], handler)
+    started.wait(5)
+    sessions.delete_session(session_id)
+    written = len(writes)
+
+    time.sleep(0.05)
+    assert len(writes) == written < 100
+    assert db.get_session(session_id) is None
+    assert job["id"] not in job_service._runs
@@ -0,0 +1,145 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import main
+from dependencies import get_message_service
+from fakes import FakeChatModel, FakeSearchTool
+from services.history import HistoryService
+from services.messages import MessageService
+from services.mindmaps import MindmapService
+
+MINDMAP = {"title": "Go", "node_id": 1, "children": [{"title": "Channels", "node_id": 2, "children": []}]}
+
+
+class StubDocsService:
+    async def aquery_node_docs(self, node, session_id):
+        return []
+
+
+@pytest.fixture
+def message_service(db):
+    llm = FakeChatModel(answer_words=5)
+    mindmaps = MindmapService()
+    mindmaps.db_client = db
+    history = HistoryService(llm=llm)
+    history.db_client = db
+
+    service = MessageService()
+    service.db_client = db
+    service.docs_service = StubDocsService()
+    service.mindmap_service = mindmaps
+    service.history_service = history
+    service.llm = llm
+    service.web_search_tool = FakeSearchTool()
+    yield service
+    history.executor.shutdown(wait=True)
+
+
+def make_chat(db, chat_type="normal"):
+    session_id = db.insert_session()
+    db.insert_mindmap(session_id, json.dumps(MINDMAP))
+    return db.insert_chat(session_id, 2, chat_type)
+
+
+def post(path, payload, service):
+    main.app.dependency_overrides[get_message_service] = lambda: service
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(path, json=payload)
+
+    try:
+        return asyncio.run(run())
+    finally:
+        main.app.dependency_overrides.clear()
+
+
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_message_route_answers_and_saves_the_turn(db, message_service):
+    chat = make_chat(db)
+    response = post("/messages/", {"chat_id": str(chat["id"]), "content": "what are channels"}, message_service)
+
+    assert response.status_code == 200
+    answer = response.json()
+    assert answer.startswith("About what are channels")
+    saved = db.get_messages(chat["id"], desc=False)
+    assert [(m["role"], m["content"]) for m in saved] == [("user", "what are channels"), ("assistant", answer)]
+
+
+def test_deepdive_message_route_searches_before_answering(db, message_service):
+    chat = make_chat(db, chat_type="deepdive")
+    message_service.llm = FakeChatModel(tool_calls_per_step=2, answer_words=5)
+    response = post("/messages/", {"chat_id": str(chat["id"]), "content": "go channels"}, message_service)
+
+    assert response.status_code == 200
+    assert response.json().startswith("About go channels")
+    assert len(message_service._search_cache) == 2
+
+
+def test_message_route_rejects_unknown_chats(message_service):
+    response = post("/messages/", {"chat_id": "999", "content": "hi"}, message_service)
+
+    assert response.status_code == 404
+
+
+def test_stream_sends_tokens_then_done_and_saves_the_answer(db, message_service):
+    chat = make_chat(db)
+    response = post("/messages/stream", {"chat_id": str(chat["id"]), "content": "what are channels"}, message_service)
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [name for name, _ in events[:-1]] == ["token"] * (len(events) - 1)
+    assert events[-1] == ("done", {})
+
+    answer = "".join(data["content"] for _, data in events[:-1])
+    assert answer.startswith("About what are channels")
+    saved = db.get_messages(chat["id"], desc=False)
+    assert [(m["role"], m["content"]) for m in saved] == [("user", "what are channels"), ("assistant", answer)]
+
+
+def test_deepdive_answers_stream_word_by_word(db, message_service):
+    chat = make_chat(db, chat_type="deepdive")
+    message_service.llm = FakeChatModel(tool_calls_per_step=1, answer_words=5)
+    response = post("/messages/stream", {"chat_id": str(chat["id"]), "content": "go channels"}, message_service)
+
+    tokens = [data["content"] for name, data in parse_sse(response.text) if name == "token"]
+    assert len(tokens) > 1
+    assert "".join(tokens).startswith("About go channels")
+
+
+def test_stream_sends_text_up_to_the_first_tool_call(db, message_service):
+    chat = make_chat(db, chat_type="deepdive")
+    message_service.llm = FakeChatModel(tool_calls_per_step=1, tool_preamble="Let me search for that.", answer_words=5)
+    response = post("/messages/stream", {"chat_id": str(chat["id"]), "content": "go channels"}, message_service)
+
+    events = parse_sse(response.text)
+    answer = "".join(data["content"] for name, data in events if name == "token")
+    assert events[-1] == ("done", {})
+    # the preamble was already on its way when the search started, so it stays in the saved answer
+    assert answer.startswith("Let me search for that. About go channels")
+    assert db.get_messages(chat["id"], desc=False)[-1]["content"] == answer
+
+
+def test_stream_reports_errors_as_an_event(db, message_service):
+    chat = make_chat(db)
+
+    async def broken(prompt, web_search):
+        yield "partial "
+        raise RuntimeError("model went away")
+
+    message_service._astream_llm = broken
+    response = post("/messages/stream", {"chat_id": str(chat["id"]), "content": "hi"}, message_service)
+
+    assert parse_sse(response.text) == [("token", {"content": "partial "}), ("error", {"detail": "model went away"})]
+    assert db.get_messages(chat["id"]) == []
@@ -0,0 +1,145 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+import main
+import metrics
+from dependencies import get_session_service
+from database.client import DatabaseClient
+from metrics import Counter, Histogram, request_id_var, span, stage_errors, stage_seconds, timed_aiter, with_context
+
+
+class FakeSessionService:
+    def get_sessions(self, limit=None, cursor=None):
+        metrics.get_logger("test").info("listing sessions")
+        return []
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test latency", labels=("stage",), buckets=(0.1, 1))
+    histogram.observe(0.05, "db")
+    histogram.observe(0.5, "db")
+    histogram.observe(5, "db")
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{stage="db",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="db",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="db",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="db"} 3' in lines
+    assert 'test_seconds_sum{stage="db"} 5.55' in lines
+
+
+def test_counter_escapes_label_values():
+    counter = Counter("test_total", "Test counter", labels=("route",))
+    counter.inc('/a"b')
+    counter.inc('/a"b', amount=2)
+
+    assert counter.value('/a"b') == 3
+    assert 'test_total{route="/a\\"b"} 3' in counter.render()
+
+
+def test_span_records_duration_and_errors():
+    before_count = stage_seconds.count("test.stage")
+    before_errors = stage_errors.value("test.stage")
+
+    with span("test.stage"):
+        pass
+    with pytest.raises(ValueError):
+        with span("test.stage"):
+            raise ValueError("boom")
+
+    assert stage_seconds.count("test.stage") == before_count + 2
+    assert stage_errors.value("test.stage") == before_errors + 1
+
+
+def test_cancellation_is_not_counted_as_an_error():
+    before_errors = stage_errors.value("test.cancel")
+
+    with pytest.raises(asyncio.CancelledError):
+        with span("test.cancel"):
+            raise asyncio.CancelledError()
+
+    assert stage_errors.value("test.cancel") == before_errors
+
+
+def test_streams_only_time_the_source():
+    async def source():
+        for item in range(3):
+            yield item
+
+    async def consume_slowly():
+        async for item in timed_aiter("test.stream", source()):
+            await asyncio.sleep(0.05)
+            if item == 1:
+                break
+
+    before_count, before_total = stage_seconds.totals().get(("test.stream",), (0, 0.0))
+    before_errors = stage_errors.value("test.stream")
+    asyncio.run(consume_slowly())
+
+    count, total = stage_seconds.totals()[("test.stream",)]
+    assert count == before_count + 1
+    assert total - before_total < 0.05
+    # the consumer stopping early closes the stream, that is not a failure
+    assert stage_errors.value("test.stream") == before_errors
+
+
+def test_db_spans_time_queries_and_count_only_sqlite_errors(tmp_path):
+    db = DatabaseClient(db_path=tmp_path / "test.db")
+    before_count = stage_seconds.count("db.query")
+    before_errors = {stage: stage_errors.value(stage) for stage in ("db.acquire", "db.query")}
+
+    with pytest.raises(ValueError):
+        with db.get_connection():
+            raise ValueError("not found")
+    with pytest.raises(sqlite3.OperationalError):
+        with db.get_connection() as conn:
+            conn.execute("SELECT * FROM missing_table")
+
+    assert stage_seconds.count("db.query") == before_count + 2
+    assert stage_errors.value("db.acquire") == before_errors["db.acquire"]
+    assert stage_errors.value("db.query") == before_errors["db.query"] + 1
+    db.close()
+
+
+def test_executor_workers_keep_the_request_id():
+    token = request_id_var.set("req-2")
+    try:
+        with ThreadPoolExecutor(2) as executor:
+            seen = list(executor.map(with_context(lambda _: request_id_var.get()), range(4)))
+    finally:
+        request_id_var.reset(token)
+
+    assert seen == ["req-2"] * 4
+
+
+def test_requests_are_tagged_and_exported(caplog):
+    main.app.dependency_overrides[get_session_service] = FakeSessionService
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            listed = await client.get("/sessions/", headers={"X-Request-ID": "abc123"})
+            generated = await client.get("/health")
+            exported = await client.get("/metrics")
+            return listed, generated, exported
+
+    handler = caplog.handler
+    handler.addFilter(metrics.RequestIdFilter())
+    metrics.logging.getLogger("synaptiq").addHandler(handler)
+    try:
+        listed, generated, exported = asyncio.run(run())
+    finally:
+        metrics.logging.getLogger("synaptiq").removeHandler(handler)
+        main.app.dependency_overrides.clear()
+
+    assert listed.headers["X-Request-ID"] == "abc123"
+    assert len(generated.headers["X-Request-ID"]) == 32
+    assert [record.request_id for record in caplog.records if record.name == "synaptiq.test"] == ["abc123"]
+
+    assert exported.headers["content-type"].startswith("text/plain")
+    assert 'synaptiq_http_requests_total{method="GET",route="/sessions/",status="200"}' in exported.text
+    assert 'synaptiq_http_request_seconds_bucket{method="GET",route="/health",status="200",le="+Inf"}' in exported.text
@@ -0,0 +1,105 @@
+import sqlite3
+
+import pytest
+
+from database import client as database
+from database.client import DatabaseClient
+
+
+HOT_QUERIES = {
+    "get_chat": ("SELECT * FROM chats WHERE session_id = ? AND node_id = ? AND type = ?", (1, 1, "normal")),
+    "get_chats": ("SELECT * FROM chats WHERE session_id = ? AND node_id = ? ORDER BY created_at DESC", (1, 1)),
+    "get_messages": ("SELECT * FROM messages WHERE chat_id = ? ORDER BY id ASC", (1,)),
+    "get_messages_page": ("SELECT * FROM messages WHERE chat_id = ? AND id < ? ORDER BY id DESC LIMIT ?", (1, 10, 5)),
+    "get_recent_messages": ("SELECT * FROM messages WHERE chat_id = ? AND id > ? ORDER BY id DESC LIMIT ?", (1, 0, 5)),
+    "get_sources": ("SELECT * FROM sources WHERE session_id = ?", (1,)),
+    "get_mindmap": ("SELECT * FROM mindmaps WHERE session_id = ?", (1,)),
+    "get_file_by_filename": ("SELECT * FROM files WHERE filename = ?", ("a.pdf",)),
+    "get_latest_job": ("SELECT * FROM jobs WHERE session_id = ? ORDER BY id DESC LIMIT 1", (1,)),
+    "get_jobs_by_status": ("SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY id", ("pending", "running")),
+}
+
+# ordered by a column outside the index, these sort the handful of matching rows
+SORTED_QUERIES = {"get_chats", "get_jobs_by_status"}
+
+
+def query_plan(db, query, params):
+    with db.get_connection() as conn:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_queries_use_an_index(db, name):
+    query, params = HOT_QUERIES[name]
+    plan = query_plan(db, query, params)
+
+    assert not [step for step in plan if step.startswith("SCAN") and "USING" not in step], plan
+    if name not in SORTED_QUERIES:
+        assert not [step for step in plan if "TEMP B-TREE" in step], plan
+
+
+def test_migrations_are_applied_once(db):
+    latest = db.get_migrations()[-1][0]
+    assert db.get_schema_version() == latest
+
+    db.init_database()
+    assert db.get_schema_version() == latest
+
+
+def test_upgrade_keeps_newest_mindmap_per_session(tmp_path, monkeypatch):
+    empty = tmp_path / "migrations"
+    empty.mkdir()
+    monkeypatch.setattr(database, "MIGRATIONS_PATH", empty)
+    db = DatabaseClient(db_path=tmp_path / "old.db")
+    db.init_database()
+    assert db.get_schema_version() == 0
+
+    session_id = db.insert_session()
+    with db.get_connection() as conn:
+        for mindmap in ('{"v": 1}', '{"v": 2}'):
+            conn.execute("INSERT INTO mindmaps (session_id, mindmap_json) VALUES (?, ?)", (session_id, mindmap))
+        conn.commit()
+
+    monkeypatch.undo()
+    db.migrate()
+
+    assert db.get_schema_version() == db.get_migrations()[-1][0]
+    assert db.get_mindmap(session_id)["mindmap_json"] == '{"v": 2}'
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.get_connection() as conn:
+            conn.execute("INSERT INTO mindmaps (session_id, mindmap_json) VALUES (?, ?)", (session_id, "{}"))
+    db.close()
+
+
+def test_insert_mindmap_replaces_the_session_mindmap(db):
+    session_id = db.insert_session()
+    db.insert_mindmap(session_id, '{"v": 1}')
+    db.insert_mindmap(session_id, '{"v": 2}')
+
+    with db.get_connection() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM mindmaps WHERE session_id = ?", (session_id,)).fetchone()[0]
+    assert count == 1
+    assert db.get_mindmap(session_id)["mindmap_json"] == '{"v": 2}'
+
+
+def test_upgrade_indexes_existing_chunks_by_session(tmp_path, monkeypatch):
+    older = tmp_path / "migrations"
+    older.mkdir()
+    for path in sorted(database.MIGRATIONS_PATH.glob("*.sql"))[:3]:
+        (older / path.name).write_text(path.read_text())
+    monkeypatch.setattr(database, "MIGRATIONS_PATH", older)
+    db = DatabaseClient(db_path=tmp_path / "old.db")
+    db.init_database()
+    assert db.get_schema_version() == 3
+
+    first, second = db.insert_session(), db.insert_session()
+    for session_id in (first, second):
+        source_id = db.insert_source("title", "web_page", "https://example.com", session_id)
+        db.insert_chunks(session_id, [(f"{source_id}-0", source_id, "goroutines and channels", "{}")])
+
+    monkeypatch.undo()
+    db.migrate()
+
+    assert [row["session_id"] for row in db.search_chunks(first, '"channels"', 10)] == [first]
+    assert [row["session_id"] for row in db.search_chunks(second, '"channels"', 10)] == [second]
+    db.close()
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from services import mindmaps
+from utils import validate_and_parse_mindmap
+
+
+MINDMAP = {
+    "title": "Go",
+    "description": "The Go language",
+    "children": [
+        {"title": "Syntax", "description": "Basics", "children": [
+            {"title": "Types", "description": "Data types", "children": []},
+        ]},
+        {"title": "Concurrency", "description": "Goroutines", "children": []},
+    ],
+}
+
+
+@pytest.fixture
+def mindmap_service(db, monkeypatch):
+    monkeypatch.setattr(mindmaps, "db_client", db)
+    return mindmaps.MindmapService(max_size=2)
+
+
+def save(db, mindmap_service, mindmap=MINDMAP):
+    session_id = db.insert_session()
+    _, mindmap_str = validate_and_parse_mindmap(json.dumps(mindmap))
+    mindmap_service.save_mindmap(session_id, mindmap_str)
+    return session_id
+
+
+def test_node_lookup_by_id(db, mindmap_service):
+    session_id = save(db, mindmap_service)
+    assert mindmap_service.get_node(session_id, 3)["title"] == "Types"
+    assert mindmap_service.get_node(str(session_id), "4")["title"] == "Concurrency"
+    with pytest.raises(HTTPException):
+        mindmap_service.get_node(session_id, 99)
+
+
+def test_parsed_mindmap_is_cached_and_evicted(db, mindmap_service, monkeypatch):
+    first, second, third = (save(db, mindmap_service) for _ in range(3))
+    mindmap_service.get_mindmap(first)
+
+    reads = []
+    original = db.get_mindmap
+    monkeypatch.setattr(db, "get_mindmap", lambda session_id: reads.append(session_id) or original(session_id))
+
+    mindmap_service.get_mindmap(first)
+    assert reads == []
+
+    mindmap_service.get_mindmap(second)
+    mindmap_service.get_mindmap(third)
+    mindmap_service.get_mindmap(first)
+    assert reads == [second, third, first]
+
+
+def test_saving_a_mindmap_invalidates_the_cache(db, mindmap_service):
+    session_id = db.insert_session()
+    assert mindmap_service.get_mindmap(session_id) is None
+
+    _, mindmap_str = validate_and_parse_mindmap(json.dumps(MINDMAP))
+    mindmap_service.save_mindmap(session_id, mindmap_str)
+    assert mindmap_service.get_mindmap(session_id)["title"] == "Go"
@@ -0,0 +1,171 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# services.docs builds the vector store client at import, it never gets called here
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+from langchain_core.documents import Document
+
+from services import docs
+
+
+class FakeVectorStore:
+    def __init__(self, results=(), error=None, delay=0):
+        self.results = list(results)
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+
+    def query(self, session_id, query, k=4, filter=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.results[:k]
+
+    async def aquery(self, session_id, query, k=4, filter=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.results[:k]
+
+
+def make_service(db, vectorstore):
+    service = docs.DocsService()
+    service.db_client = db
+    service.vectorstore_client = vectorstore
+    return service
+
+
+def add_chunks(db, session_id, texts):
+    source_id = db.insert_source("title", "web_page", "https://example.com", session_id)
+    db.insert_chunks(session_id, [(f"{source_id}-{i}", source_id, text, f'{{"source_id": {source_id}}}') for i, text in enumerate(texts)])
+    return source_id
+
+
+def test_keyword_search_is_scoped_to_the_session(db):
+    first, second = db.insert_session(), db.insert_session()
+    add_chunks(db, first, ["goroutines and channels", "garbage collection in go"])
+    add_chunks(db, second, ["channels in rust"])
+    service = make_service(db, FakeVectorStore())
+
+    results = service.query_all_docs("channels?", first, mode="keyword")
+
+    assert [doc.page_content for doc in results] == ["goroutines and channels"]
+    assert service.vectorstore_client.calls == 0
+
+
+def test_session_ids_in_queries_do_not_match_every_chunk(db):
+    session_id = db.insert_session()
+    add_chunks(db, session_id, ["goroutines and channels"])
+
+    # the session column only narrows the match, query terms are looked up in the text
+    assert db.search_chunks(session_id, f'"{session_id}"', 10) == []
+    assert len(db.search_chunks(session_id, '"channels"', 10)) == 1
+
+
+def test_chunks_follow_their_source_and_session(db):
+    session_id = db.insert_session()
+    add_chunks(db, session_id, ["first source"])
+    add_chunks(db, session_id, ["second source"])
+
+    db.delete_sources(session_id)
+    assert db.search_chunks(session_id, '"source"', 10) == []
+
+    add_chunks(db, session_id, ["third source"])
+    db.delete_session(session_id)
+    assert db.search_chunks(session_id, '"source"', 10) == []
+
+
+def test_hybrid_results_fuse_both_rankings(db):
+    session_id = db.insert_session()
+    source_id = add_chunks(db, session_id, ["alpha beta", "beta gamma"])
+    vector_only = Document(id="v-1", page_content="semantically close", metadata={})
+    both = Document(id=f"{source_id}-1", page_content="beta gamma", metadata={})
+    service = make_service(db, FakeVectorStore([vector_only, both]))
+
+    results = service.query_all_docs("gamma", session_id)
+
+    assert [doc.id for doc in results] == [both.id, vector_only.id]
+
+
+def test_failed_vector_search_falls_back_to_keywords_and_cools_down(db):
+    session_id = db.insert_session()
+    add_chunks(db, session_id, ["offline keywords still work"])
+    vectorstore = FakeVectorStore(error=RuntimeError("embedding api down"))
+    service = make_service(db, vectorstore)
+
+    assert [doc.page_content for doc in service.query_all_docs("keywords", session_id)] == ["offline keywords still work"]
+    assert [doc.page_content for doc in service.query_all_docs("offline", session_id)] == ["offline keywords still work"]
+    assert vectorstore.calls == 1
+
+
+def test_slow_vector_search_is_cut_off(db, monkeypatch):
+    monkeypatch.setattr(docs, "VECTOR_SEARCH_TIMEOUT", 0.05)
+    session_id = db.insert_session()
+    add_chunks(db, session_id, ["slow embeddings"])
+    service = make_service(db, FakeVectorStore([Document(page_content="late", metadata={})], delay=1))
+
+    results = asyncio.run(service.aquery_all_docs("embeddings", session_id))
+
+    assert [doc.page_content for doc in results] == ["slow embeddings"]
+
+
+def test_timed_out_vector_searches_hold_their_slot_until_they_finish(db, monkeypatch):
+    monkeypatch.setattr(docs, "VECTOR_SEARCH_TIMEOUT", 0.01)
+    monkeypatch.setattr(docs, "VECTOR_SEARCH_COOLDOWN", 0)
+    monkeypatch.setattr(docs, "VECTOR_SEARCH_MAX_IN_FLIGHT", 2)
+    session_id = db.insert_session()
+    add_chunks(db, session_id, ["slow embeddings"])
+    vectorstore = FakeVectorStore(delay=0.2)
+    service = make_service(db, vectorstore)
+
+    async def search_three_times():
+        for query in ("a embeddings", "b embeddings", "c embeddings"):
+            await service.aquery_all_docs(query, session_id)
+        # the third search found both slots taken by the timed out ones
+        calls = vectorstore.calls
+        await asyncio.sleep(0.3)
+        await service.aquery_all_docs("d embeddings", session_id)
+        return calls
+
+    assert asyncio.run(search_three_times()) == 2
+    assert vectorstore.calls == 3
+
+
+def test_worker_threads_search_without_the_async_client(db):
+    session_id = db.insert_session()
+    source_id = add_chunks(db, session_id, ["alpha beta", "beta gamma"])
+    both = Document(id=f"{source_id}-1", page_content="beta gamma", metadata={})
+    vectorstore = FakeVectorStore([both])
+
+    async def attached_to_the_app_loop(*args, **kwargs):
+        raise RuntimeError("attached to a different loop")
+
+    vectorstore.aquery = attached_to_the_app_loop
+    service = make_service(db, vectorstore)
+
+    with ThreadPoolExecutor(2, "retrieval") as executor:
+        results = list(executor.map(lambda query: service.query_all_docs(query, session_id), ["gamma", "alpha"]))
+
+    assert [doc.id for doc in results[0]] == [both.id]
+    assert service._vector_down_until == 0
+    # fused results are cached, so warming up actually helps the next chat
+    service.query_all_docs("gamma", session_id)
+    assert vectorstore.calls == 2
+
+
+def test_concurrent_invalidations_are_not_lost(db):
+    service = make_service(db, FakeVectorStore())
+
+    def invalidate_many(_):
+        for _ in range(500):
+            service.invalidate_retrieval(1)
+
+    with docs.ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(invalidate_many, range(8)))
+
+    assert service._session_versions[1] == 4000
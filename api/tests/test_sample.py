@@ -1,22 +1,27 @@
-from dotenv import load_dotenv
-load_dotenv()
+import benchmark
 
-import requests
-from services.sources import sources_service
 
-# def test_create_session():
-#     payload = [
-#         {"url": "https://www.youtube.com/watch?v=PeMlggyqz0Y", "type": "youtube"}
-#     ]
-#     response = requests.post("http://localhost:6463/sessions", json=payload)
-#     assert response.status_code == 200
+def test_benchmark_runs_offline_end_to_end(tmp_path):
+    options = benchmark.parse_args([
+        "--sessions", "1", "--sources", "2", "--words", "400",
+        "--turns", "4", "--queries", "10", "--concurrency", "2",
+        "--workdir", str(tmp_path), "--json", str(tmp_path / "results.json"),
+    ])
+    results = benchmark.run_benchmark(options)
 
-# def test_get_sessions():
-#     response = requests.get("http://localhost:6463/sessions")
-#     assert response.status_code == 200
+    assert [result["scenario"] for result in results] == ["ingest", "chat", "retrieval"]
+    for result in results:
+        assert result["errors"] == 0, result["first_error"]
+        assert result["p50_ms"] <= result["p99_ms"]
+    assert [result["ops"] for result in results] == [1, 4, 10]
+    assert "llm" in results[1]["stages"] and "tool_call" in results[1]["stages"]
+    for result in results:
+        assert result["rss_peak_growth_mb"] is None or 0 <= result["rss_peak_growth_mb"] <= result["process_rss_peak_mb"]
+    assert "ops/s" in benchmark.format_results(results)
 
-def test_get_all_sources():
-    sources = sources_service.get_all_sources(1)
-    print(sources)
 
-test_get_all_sources()
\ No newline at end of file
+def test_percentile_uses_nearest_rank():
+    values = list(range(1, 101))
+    assert benchmark.percentile(values, 50) == 50
+    assert benchmark.percentile(values, 99) == 99
+    assert benchmark.percentile([], 99) == 0.0
@@ -0,0 +1,113 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from database.client import DatabaseClient
+from services.jobs import JobContext
+from services import sessions as sessions_module
+from utils import estimate_tokens
+from services.sessions import SessionService
+
+
+class FlakySourceService:
+    def __init__(self):
+        self.added = []
+        self._lock = threading.Lock()
+
+    def add_source(self, source, session_id):
+        if "broken" in source.url:
+            raise RuntimeError("404 Not Found")
+        with self._lock:
+            self.added.append(source.url)
+
+
+def test_one_failing_source_does_not_stop_the_others(tmp_path):
+    db = DatabaseClient(db_path=tmp_path / "test.db")
+    session_id = db.insert_session()
+    job = db.insert_job(session_id, "[]")
+    context = JobContext(db, job["id"], threading.Event())
+
+    sessions = SessionService()
+    sessions.source_service = FlakySourceService()
+    sources = [{"url": f"https://example.com/{name}", "type": "web_page"} for name in ("a", "broken", "b", "c")]
+
+    context.start_stage("sources", total=len(sources))
+    failures = sessions._add_sources_concurrently(sources, session_id, context)
+
+    assert failures == [{"url": "https://example.com/broken", "error": "404 Not Found"}]
+    assert sorted(sessions.source_service.added) == ["https://example.com/a", "https://example.com/b", "https://example.com/c"]
+    assert context.progress["sources"] == {
+        "done": 3,
+        "total": 4,
+        "failed": [{"item": "https://example.com/broken", "error": "404 Not Found"}],
+    }
+    assert json.loads(db.get_job(job["id"])["progress"]) == context.progress
+    db.close()
+
+
+def test_cancel_during_warm_up_does_not_cancel_a_finished_ingestion(tmp_path):
+    db = DatabaseClient(db_path=tmp_path / "test.db")
+    session_id = db.insert_session()
+    job = db.insert_job(session_id, "[]")
+    context = JobContext(db, job["id"], threading.Event())
+    warmed = []
+
+    def query_node_docs(node, session_id):
+        # the user cancels while the first node is being warmed
+        context.cancel_event.set()
+        warmed.append(node["node_id"])
+
+    sessions = SessionService()
+    sessions.mindmap_service = SimpleNamespace(get_mindmap=lambda session_id: {
+        "title": "Go", "node_id": 1, "children": [{"title": "Channels", "node_id": 2, "children": []}]})
+    sessions.docs_service = SimpleNamespace(query_node_docs=query_node_docs)
+
+    sessions._warm_node_retrieval(session_id, context)
+
+    assert len(warmed) >= 1
+    assert context.progress["retrieval"]["total"] == 2
+    db.close()
+
+
+class RecordingLLM:
+    def __init__(self, output_chars=396):
+        self.calls = []
+        self.output_chars = output_chars
+
+    def invoke(self, prompt):
+        text = prompt.to_string()
+        self.calls.append("merge" if "Merge the following outlines" in text else "outline")
+        return "o" * self.output_chars
+
+
+@pytest.fixture
+def small_budget(monkeypatch):
+    monkeypatch.setattr(sessions_module, "MINDMAP_TOKEN_BUDGET", 150)
+    monkeypatch.setattr(sessions_module, "MINDMAP_GROUP_TOKENS", 250)
+
+
+def test_outlines_are_merged_until_they_fit(small_budget):
+    sessions = SessionService()
+    sessions.llm = RecordingLLM()
+
+    outlines = sessions._summarize_docs(["d" * 396] * 8)
+
+    # 8 chunks -> 4 outlines -> 2 merges -> 1 merge that fits the budget
+    assert sessions.llm.calls == ["outline"] * 4 + ["merge"] * 3
+    assert outlines == "o" * 396
+
+
+def test_merge_rounds_are_bounded_and_truncation_is_logged(small_budget, monkeypatch):
+    monkeypatch.setattr(sessions_module, "MINDMAP_MAX_REDUCE_ROUNDS", 1)
+    warnings = []
+    monkeypatch.setattr(sessions_module.logger, "warning", lambda *args: warnings.append(args))
+    sessions = SessionService()
+    sessions.llm = RecordingLLM()
+
+    outlines = sessions._summarize_docs(["d" * 396] * 8)
+
+    assert sessions.llm.calls == ["outline"] * 4 + ["merge"] * 2
+    assert estimate_tokens(outlines) == 150 + 1
+    assert len(warnings) == 1 and warnings[0][2] == 1
@@ -0,0 +1,94 @@
+import os
+import time
+
+# services.docs builds the vector store client at import, it never gets called here
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+import pytest
+
+from services import docs
+from source_cache import SourceCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SourceCache(path=tmp_path / "sources.db")
+    yield cache
+    cache.close()
+
+
+def test_chunks_round_trip(cache):
+    cache.put("pdf:abc", "chunker", [(1, "first page"), (2, "second page")])
+
+    assert cache.get("pdf:abc", "chunker") == [(1, "first page"), (2, "second page")]
+    assert cache.get("pdf:abc", "other-chunker") is None
+
+
+def test_expired_entries_are_dropped(cache):
+    cache.put("web_page:https://example.com", "chunker", [(None, "text")], ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("web_page:https://example.com", "chunker") is None
+    assert cache.total_bytes == 0
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path):
+    cache = SourceCache(path=tmp_path / "sources.db")
+    cache.put("a", "c", [(None, "x")])
+    cache.max_bytes = cache.total_bytes * 3 - 1
+    cache.put("b", "c", [(None, "x")])
+    cache.get("a", "c")
+    cache.put("d", "c", [(None, "x")])
+
+    assert cache.get("a", "c") is not None
+    assert cache.get("b", "c") is None
+    cache.close()
+
+
+def test_shared_sources_are_only_parsed_once(cache):
+    service = docs.DocsService()
+    service.source_cache = cache
+    fetched, stored = [], []
+    service._get_web_page_content = lambda url: fetched.append(url) or "some page text " * 200
+    service._store_vectorized_docs = lambda batch: stored.append(list(batch))
+
+    service.add_docs("https://example.com", "web_page", session_id=1, source_id=10)
+    service.add_docs("https://example.com", "web_page", session_id=2, source_id=20)
+
+    assert fetched == ["https://example.com"]
+    assert [doc.page_content for doc in stored[0]] == [doc.page_content for doc in stored[1]]
+    assert {doc.metadata["session_id"] for doc in stored[1]} == {2}
+    assert {doc.metadata["source_id"] for doc in stored[1]} == {20}
+
+
+def test_failed_ingestion_is_not_cached(cache):
+    service = docs.DocsService()
+    service.source_cache = cache
+    service._get_web_page_content = lambda url: "text " * 1000
+
+    def fail_midway(batch):
+        next(iter(batch))
+        raise RuntimeError("embedding failed")
+
+    service._store_vectorized_docs = fail_midway
+    with pytest.raises(RuntimeError):
+        service.add_docs("https://example.com", "web_page", session_id=1, source_id=10)
+
+    assert cache.get("web_page:https://example.com", docs.CHUNKER) is None
+
+
+def test_sources_over_the_size_cap_are_not_cached(cache, monkeypatch):
+    monkeypatch.setattr(docs, "SOURCE_CACHE_MAX_ENTRY_BYTES", 5000)
+    service = docs.DocsService()
+    service.source_cache = cache
+    fetched, stored = [], []
+    service._get_web_page_content = lambda url: fetched.append(url) or "some page text " * 1000
+    service._store_vectorized_docs = lambda batch: stored.append(list(batch))
+
+    service.add_docs("https://example.com", "web_page", session_id=1, source_id=10)
+    service.add_docs("https://example.com", "web_page", session_id=2, source_id=20)
+
+    # every chunk still reaches the store, only the cache entry is skipped
+    assert fetched == ["https://example.com"] * 2
+    assert len(stored[0]) == len(stored[1]) > 5
+    assert cache.total_bytes == 0
@@ -0,0 +1,72 @@
+import pytest
+
+import utils
+from utils import estimate_tokens, truncate_to_tokens, group_by_token_budget, is_rate_limited, retry_with_backoff
+
+
+class RateLimitError(Exception):
+    code = 429
+
+
+def test_rate_limit_is_detected_through_wrapped_errors():
+    try:
+        try:
+            raise RateLimitError("slow down")
+        except RateLimitError as e:
+            raise RuntimeError("Error embedding content") from e
+    except RuntimeError as wrapped:
+        assert is_rate_limited(wrapped)
+
+    assert not is_rate_limited(ValueError("bad input"))
+
+
+def test_rate_limit_ignores_429_and_quota_in_messages():
+    class ResourceExhausted(Exception):
+        pass
+
+    class HTTPError(Exception):
+        def __init__(self, status_code):
+            super().__init__(f"HTTP {status_code}")
+            self.response = type("Response", (), {"status_code": status_code})()
+
+    assert not is_rate_limited(ValueError("chunk 1429-3 of https://example.com/quota/429 is invalid"))
+    assert is_rate_limited(ResourceExhausted("try later"))
+    assert is_rate_limited(HTTPError(429))
+    assert not is_rate_limited(HTTPError(500))
+
+
+def test_retry_with_backoff_retries_only_rate_limits(monkeypatch):
+    monkeypatch.setattr(utils.time, "sleep", lambda _: None)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RateLimitError("429")
+        return "ok"
+
+    assert retry_with_backoff(flaky) == "ok"
+    assert len(calls) == 3
+
+    def broken():
+        calls.append(1)
+        raise ValueError("bad input")
+
+    calls.clear()
+    with pytest.raises(ValueError):
+        retry_with_backoff(broken)
+    assert len(calls) == 1
+
+
+def test_estimate_tokens_counts_about_four_characters_per_token():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("x" * 400) == 101
+    assert estimate_tokens(truncate_to_tokens("x" * 1000, 100)) == 101
+
+
+def test_groups_fill_up_to_the_budget_in_order():
+    texts = ["a" * 396, "b" * 396, "c" * 396, "d" * 2000]
+
+    # 100 tokens each, so two fit a 250 token budget and an oversized text gets a group of its own
+    assert group_by_token_budget(texts, 250) == [["a" * 396, "b" * 396], ["c" * 396], ["d" * 2000]]
+    assert group_by_token_budget([], 250) == []
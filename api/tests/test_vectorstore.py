@@ -0,0 +1,191 @@
+import asyncio
+import os
+
+# vectorstore.client builds its embedding client at import, it never gets called here
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+
+import pytest
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from vectorstore import client as vectorstore
+from vectorstore.client import VectoreStoreClient
+from vectorstore.gc import collect_garbage, vacuum
+
+
+def make_client(path):
+    # the chroma client is opened on first use, so it picks up the temp path
+    client = VectoreStoreClient()
+    client.vectorstore_path = path
+    client.embeddings = DeterministicFakeEmbedding(size=16)
+    return client
+
+
+@pytest.fixture
+def store(tmp_path):
+    return make_client(tmp_path / "chroma")
+
+
+def make_docs(session_id, source_id, count):
+    return [Document(page_content=f"{source_id} chunk {i}", metadata={"session_id": session_id, "source_id": source_id}) for i in range(count)]
+
+
+def add_source_docs(db, store, session_id, count=3):
+    source_id = db.insert_source("title", "web_page", "https://example.com", session_id)
+    store.add_documents(session_id, make_docs(session_id, source_id, count), ids=[f"{source_id}-{i}" for i in range(count)])
+    return source_id
+
+
+def test_each_session_gets_its_own_collection(db, store):
+    first = db.insert_session()
+    second = db.insert_session()
+    add_source_docs(db, store, first)
+    add_source_docs(db, store, second, count=2)
+
+    assert sorted(store.list_session_ids()) == [first, second]
+    assert {doc.metadata["session_id"] for doc in store.query(first, "chunk", k=10)} == {first}
+    assert len(store.query(second, "chunk", k=10)) == 2
+
+
+def test_reads_of_unknown_sessions_do_not_create_collections(store):
+    assert store.query(42, "anything") == []
+    assert asyncio.run(store.aquery(42, "anything")) == []
+    assert store.get_all_session_documents(42) == []
+    assert list(store.iter_document_metadata(42, batch_size=10)) == []
+    assert store.list_session_ids() == []
+
+
+def test_async_query_searches_the_session_collection(db, store):
+    session_id = db.insert_session()
+    add_source_docs(db, store, session_id)
+
+    docs = asyncio.run(store.aquery(session_id, "chunk", k=10))
+
+    assert len(docs) == 3 and {doc.metadata["session_id"] for doc in docs} == {session_id}
+
+
+def test_deleting_a_session_drops_its_collection(db, store):
+    session_id = db.insert_session()
+    add_source_docs(db, store, session_id)
+
+    store.delete_session_documents(session_id)
+
+    assert store.list_session_ids() == []
+    assert store.query(session_id, "chunk") == []
+
+
+def add_legacy_docs(store, session_id, source_id, count):
+    legacy = Chroma(client=store.client, collection_name=vectorstore.LEGACY_COLLECTION_NAME, embedding_function=store.embeddings)
+    legacy.add_documents(make_docs(session_id, source_id, count), ids=[f"{source_id}-{i}" for i in range(count)])
+
+
+def test_reads_leave_legacy_documents_alone(db, store):
+    session_id = db.insert_session()
+    add_legacy_docs(store, session_id, 1, 3)
+
+    assert store.get_all_session_documents(session_id) == []
+    assert store.list_session_ids() == []
+    assert store.get_legacy_session_ids() == {session_id}
+
+
+def test_migration_moves_legacy_documents_to_session_collections(db, store):
+    session_id = db.insert_session()
+    add_legacy_docs(store, session_id, 1, 3)
+    add_legacy_docs(store, session_id + 1, 2, 2)
+
+    assert store.needs_legacy_migration()
+    assert store.migrate_legacy_documents() == 2
+
+    assert len(store.get_all_session_documents(session_id)) == 3
+    assert len(store.get_all_session_documents(session_id + 1)) == 2
+    assert store.get_legacy_session_ids() == set()
+    assert vectorstore.LEGACY_COLLECTION_NAME not in [collection.name for collection in store.client.list_collections()]
+    # the next startup only checks the marker file, it does not open chroma
+    assert not make_client(store.vectorstore_path).needs_legacy_migration()
+
+
+def test_gc_drops_deleted_sessions_and_orphaned_sources(db, store):
+    kept = db.insert_session()
+    deleted = db.insert_session()
+    add_source_docs(db, store, kept)
+    add_source_docs(db, store, kept)
+    add_source_docs(db, store, deleted)
+    db.delete_sources(kept)
+    add_source_docs(db, store, kept, count=2)
+    db.delete_session(deleted)
+
+    stats = collect_garbage(db, store, batch_size=2)
+
+    assert stats == {"collections": 2, "dropped": 1, "scanned": 8, "orphaned": 6, "deleted": 6}
+    assert store.list_session_ids() == [kept]
+    assert len(store.get_all_session_documents(kept)) == 2
+
+
+def test_gc_keeps_sources_inserted_mid_scan(db, store, monkeypatch):
+    session_id = db.insert_session()
+    add_source_docs(db, store, session_id, count=2)
+    db.delete_sources(session_id)
+    scan = store.iter_document_metadata
+    added = []
+
+    def scan_while_ingesting(session_id, batch_size):
+        for batch in scan(session_id, batch_size):
+            if not added:
+                added.append(add_source_docs(db, store, session_id, count=2))
+            yield batch
+
+    monkeypatch.setattr(store, "iter_document_metadata", scan_while_ingesting)
+
+    stats = collect_garbage(db, store, batch_size=1)
+
+    assert stats["deleted"] == 2
+    assert {doc.metadata["source_id"] for doc in store.query(session_id, "chunk", k=10)} == set(added)
+
+
+def test_gc_dry_run_keeps_everything(db, store):
+    session_id = db.insert_session()
+    add_source_docs(db, store, session_id)
+    db.delete_sources(session_id)
+    add_legacy_docs(store, session_id + 1, 99, 2)
+
+    stats = collect_garbage(db, store, dry_run=True)
+
+    assert stats["orphaned"] == 3 and stats["deleted"] == 0
+    assert len(store.get_all_session_documents(session_id)) == 3
+    assert store.get_legacy_session_ids() == {session_id + 1}
+
+
+def test_gc_migrates_legacy_documents_before_collecting(db, store):
+    kept = db.insert_session()
+    source_id = db.insert_source("title", "web_page", "https://example.com", kept)
+    add_legacy_docs(store, kept, source_id, 2)
+    add_legacy_docs(store, kept + 1, 99, 2)
+
+    stats = collect_garbage(db, store)
+
+    assert stats["dropped"] == 1 and stats["deleted"] == 0
+    assert store.list_session_ids() == [kept]
+    assert len(store.get_all_session_documents(kept)) == 2
+    assert store.get_legacy_session_ids() == set()
+
+
+def test_delete_source_documents_leaves_other_sources(db, store):
+    session_id = db.insert_session()
+    first = add_source_docs(db, store, session_id)
+    add_source_docs(db, store, session_id)
+
+    store.delete_source_documents(session_id, first)
+
+    assert store.get_source_documents(session_id, first) == []
+    assert len(store.get_all_session_documents(session_id)) == 3
+
+
+def test_vacuum_shrinks_the_chroma_file(db, store):
+    session_id = db.insert_session()
+    add_source_docs(db, store, session_id, count=500)
+    store.delete_session_documents(session_id)
+
+    before, after = vacuum(store.vectorstore_path)
+
+    assert after < before
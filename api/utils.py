@@ -1,10 +1,86 @@
 import os
 import json
-import requests
-from bs4 import BeautifulSoup
+import time
+import random
+import threading
+from collections import OrderedDict
+from llm import LLM_BACKEND
+
+class LRUCache:
+    def __init__(self, max_size=128, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return entry[0] if entry is not None else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+class lazy_property:
+    # built on first access and then stored on the instance, so clients are only created when used.
+    # assigning the attribute directly (tests, overrides) skips the factory entirely
+    def __init__(self, factory):
+        self.factory = factory
+        self.name = factory.__name__
+        self._lock = threading.Lock()
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        with self._lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.factory(instance)
+        return instance.__dict__[self.name]
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+PAGE_MAX_LIMIT = 500
+CHARS_PER_TOKEN = 4  # close enough for budgeting Gemini prompts
+
+def set_next_cursor(response, items, limit, cursor):
+    # a full page means there may be more, the client passes the header back as ?cursor=
+    if limit is not None and len(items) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = str(cursor)
 
 def check_env_vars():
-    required_env_vars = ["GOOGLE_API_KEY"]
+    required_env_vars = [] if LLM_BACKEND == "fake" else ["GOOGLE_API_KEY"]
     for var in required_env_vars:
         if os.getenv(var) is None:
             raise ValueError(f"Environment variable {var} is not set")
@@ -34,6 +110,49 @@ def validate_and_parse_mindmap(mindmap_str):
     
     return mindmap_title, mindmap_str
 
+# google.api_core and the openai-style clients raise these for a 429
+RATE_LIMIT_ERRORS = ("ResourceExhausted", "TooManyRequests", "RateLimitError")
+
+def is_rate_limited(error):
+    # client libraries tend to wrap the original 429, so walk the whole cause chain.
+    # only status codes and error types count, messages can carry "429" inside an id or url
+    while error is not None:
+        response = getattr(error, "response", None)
+        statuses = (getattr(error, "code", None), getattr(error, "status_code", None), getattr(response, "status_code", None))
+        if 429 in statuses or type(error).__name__ in RATE_LIMIT_ERRORS:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+def retry_with_backoff(fn, retries=5, base_delay=1.0, max_delay=30.0, should_retry=is_rate_limited):
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries or not should_retry(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def truncate_to_tokens(text, tokens):
+    return text[:tokens * CHARS_PER_TOKEN]
+
+def group_by_token_budget(texts, budget):
+    groups, group, group_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if group and group_tokens + tokens > budget:
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(text)
+        group_tokens += tokens
+    if group:
+        groups.append(group)
+    return groups
+
 def get_yt_video_id(url):
     if "youtube.com" in url:
         video_id = url.split("v=")[-1].split("&")[0]
@@ -41,26 +160,14 @@ def get_yt_video_id(url):
     else:
         raise ValueError("Invalid YouTube URL")
 
-def get_yt_title(url):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, "html.parser")
-    title = soup.find("title").text
-    title = title.split("- YouTube")[0]
-    return title
-
-
-def get_node_title_desc(mindmap_json, target_node_id):
-        # TODO: find a better way to get the node title by id
-        def traverse_node(node):
-            if node.get("node_id") == target_node_id:
-                return node.get("title"), node.get("description")
-            
-            if "children" in node and isinstance(node["children"], list):
-                for child in node["children"]:
-                    result = traverse_node(child)
-                    if result:
-                        return result
-            
-            return None
-        
-        return traverse_node(mindmap_json)
\ No newline at end of file
+def index_mindmap_nodes(mindmap_json):
+    nodes = {}
+    stack = [mindmap_json]
+    while stack:
+        node = stack.pop()
+        if "node_id" in node:
+            nodes[node["node_id"]] = node
+        children = node.get("children")
+        if isinstance(children, list):
+            stack.extend(children)
+    return nodes
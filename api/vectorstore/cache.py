@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import time
+from array import array
+from pathlib import Path
+from langchain_core.embeddings import Embeddings
+from database.cache import SqliteCache
+from utils import LRUCache
+from metrics import span
+
+EMBEDDING_CACHE_PATH = Path(__file__).parent / ".sqlite" / "embeddings.db"
+EMBEDDING_CACHE_MAX_BYTES = 512 * 1024 * 1024
+EMBEDDING_CACHE_POOL_SIZE = 4
+QUERY_CACHE_SIZE = 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, content_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(SqliteCache):
+    table = "embeddings"
+    key_columns = ("model", "content_hash")
+    schema = SCHEMA
+    evict_order = "last_used ASC, rowid ASC"
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+        super().__init__(path, max_bytes, pool_size=EMBEDDING_CACHE_POOL_SIZE)
+
+    def get_many(self, model, hashes):
+        if not hashes:
+            return {}
+        found = {}
+        with self.connection() as conn:
+            # stay well under SQLITE_MAX_VARIABLE_NUMBER
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ", ".join("?" for _ in batch)
+                rows = conn.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? AND content_hash IN ({placeholders})",
+                    (model, *batch),
+                ).fetchall()
+                for row in rows:
+                    found[row["content_hash"]] = array("f", row["vector"]).tolist()
+                if rows:
+                    conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND content_hash IN ({placeholders})",
+                        (time.time(), model, *batch),
+                    )
+            conn.commit()
+        return found
+
+    def put_many(self, model, items):
+        now = time.time()
+        rows = []
+        for hash_, vector in items.items():
+            blob = array("f", vector).tobytes()
+            rows.append({"model": model, "content_hash": hash_, "vector": blob, "size": len(blob), "last_used": now})
+        # vectors never change for a given model and text, an existing entry is kept
+        self._put_rows(rows, replace=False)
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, embeddings, model, cache=None, query_cache_size=QUERY_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache or EmbeddingCache()
+        # queries are embedded with a different task type than documents, so they never share a key
+        self.query_model = f"{model}:query"
+        self.query_cache = LRUCache(max_size=query_cache_size)
+        self.query_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def embed_documents(self, texts):
+        hashes = [content_hash(text) for text in texts]
+        cached = self.cache.get_many(self.model, list(set(hashes)))
+
+        missing = {}
+        for hash_, text in zip(hashes, texts):
+            if hash_ not in cached and hash_ not in missing:
+                missing[hash_] = text
+
+        if missing:
+            with span("embedding.documents"):
+                vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model, fresh)
+            cached.update(fresh)
+
+        return [cached[hash_] for hash_ in hashes]
+
+    def embed_query(self, text):
+        hash_ = content_hash(text)
+        vector = self._get_cached_query(hash_)
+        if vector is None:
+            with span("embedding.query"):
+                vector = self.embeddings.embed_query(text)
+            self._put_cached_query(hash_, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        hash_ = content_hash(text)
+        vector = self.query_cache.get(hash_)
+        if vector is not None:
+            self.query_stats["memory_hits"] += 1
+            return vector
+
+        loop = asyncio.get_running_loop()
+        vector = await loop.run_in_executor(None, self._get_cached_query, hash_, False)
+        if vector is None:
+            with span("embedding.query"):
+                vector = await self.embeddings.aembed_query(text)
+            await loop.run_in_executor(None, self._put_cached_query, hash_, vector)
+        return vector
+
+    def _get_cached_query(self, hash_, check_memory=True):
+        if check_memory:
+            vector = self.query_cache.get(hash_)
+            if vector is not None:
+                self.query_stats["memory_hits"] += 1
+                return vector
+
+        vector = self.cache.get_many(self.query_model, [hash_]).get(hash_)
+        if vector is not None:
+            self.query_stats["disk_hits"] += 1
+            self.query_cache.set(hash_, vector)
+            return vector
+
+        self.query_stats["misses"] += 1
+        return None
+
+    def _put_cached_query(self, hash_, vector):
+        self.query_cache.set(hash_, vector)
+        self.cache.put_many(self.query_model, {hash_: vector})
@@ -1,33 +1,202 @@
-
-from langchain_chroma import Chroma
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+import threading
 from pathlib import Path
+from fastapi.concurrency import run_in_threadpool
+from vectorstore.cache import CachedEmbeddings
+from utils import LRUCache, lazy_property
+from llm import get_embeddings, get_embedding_model
 
 VECTORESTORE_PATH = Path(__file__).parent / ".chroma"
+SESSION_COLLECTION_PREFIX = "session-"
+# every session used to share this collection, migrate_legacy_documents moves them out of it
+LEGACY_COLLECTION_NAME = "langchain"
+COLLECTION_CACHE_SIZE = 256
+LEGACY_MOVE_BATCH_SIZE = 1000
+# written once the shared collection is gone, startup then skips opening chroma
+LEGACY_MIGRATED_MARKER = "legacy-migrated"
 
 class VectoreStoreClient:
     def __init__(self):
         self.vectorstore_path = VECTORESTORE_PATH
-        self.embeddings = GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001")
-        self.vectorstore = Chroma(
-            persist_directory=self.vectorstore_path,
-            embedding_function=self.embeddings
-        )
-
-    def add_documents(self, documents):
-        ids = self.vectorstore.add_documents(documents)
+        # one collection per session, so a search only walks the index of its own session
+        self._stores = LRUCache(max_size=COLLECTION_CACHE_SIZE)
+        self._lock = threading.Lock()
+
+    # chroma and the embedding client are slow to import and open, they are built on first use.
+    # the app builds the embeddings in its lifespan, on the event loop the async searches run on
+
+    @lazy_property
+    def embeddings(self):
+        return CachedEmbeddings(get_embeddings(), model=get_embedding_model())
+
+    @lazy_property
+    def client(self):
+        import chromadb
+        return chromadb.PersistentClient(path=str(self.vectorstore_path))
+
+    def add_documents(self, session_id, documents, ids=None):
+        ids = self._get_store(session_id).add_documents(documents, ids=ids)
         return ids
-        
-    def get_all_session_documents(self, session_id):
-        all_docs = self.vectorstore.get(where={"session_id": int(session_id)})
+
+    def get_all_session_documents(self, session_id, limit=None, offset=None):
+        store = self._get_store(session_id, create=False)
+        if store is None:
+            return []
+        all_docs = store.get(limit=limit, offset=offset, include=["documents"])
         return all_docs["documents"]
-    
-    def get_source_documents(self, source_id):
-        docs = self.vectorstore.get(where={"source_id": int(source_id)})
+
+    def get_source_documents(self, session_id, source_id):
+        store = self._get_store(session_id, create=False)
+        if store is None:
+            return []
+        docs = store.get(where={"source_id": int(source_id)})
         return docs["documents"]
 
-    def query(self, query, k=4, filter=None):
-        docs =  self.vectorstore.similarity_search(query, k=k, filter=filter)
+    def delete_session_documents(self, session_id):
+        from chromadb.errors import NotFoundError
+        session_id = int(session_id)
+        with self._lock:
+            self._stores.pop(session_id)
+            try:
+                self.client.delete_collection(self._collection_name(session_id))
+            except NotFoundError:
+                pass
+            self._delete_legacy_documents(session_id)
+
+    def delete_source_documents(self, session_id, source_id):
+        store = self._get_store(session_id, create=False)
+        if store is not None:
+            store.delete(where={"source_id": int(source_id)})
+
+    def delete_documents(self, session_id, ids):
+        store = self._get_store(session_id, create=False)
+        if store is not None:
+            store.delete(ids=ids)
+
+    def list_session_ids(self):
+        session_ids = []
+        for collection in self.client.list_collections():
+            if collection.name.startswith(SESSION_COLLECTION_PREFIX):
+                session_ids.append(int(collection.name[len(SESSION_COLLECTION_PREFIX):]))
+        return session_ids
+
+    def iter_document_metadata(self, session_id, batch_size):
+        store = self._get_store(session_id, create=False)
+        if store is None:
+            return
+        offset = 0
+        while True:
+            page = store.get(limit=batch_size, offset=offset, include=["metadatas"])
+            if not page["ids"]:
+                return
+            yield page["ids"], page["metadatas"]
+            offset += len(page["ids"])
+
+    def get_legacy_session_ids(self):
+        legacy = self._get_legacy_collection()
+        if legacy is None:
+            return set()
+        session_ids, offset = set(), 0
+        while True:
+            page = legacy.get(limit=LEGACY_MOVE_BATCH_SIZE, offset=offset, include=["metadatas"])
+            if not page["ids"]:
+                return session_ids
+            session_ids.update(int(metadata["session_id"]) for metadata in page["metadatas"] if metadata and "session_id" in metadata)
+            offset += len(page["ids"])
+
+    def migrate_legacy_documents(self):
+        # run before serving and by the gc, reads never write so they only see migrated sessions
+        session_ids = self.get_legacy_session_ids()
+        for session_id in sorted(session_ids):
+            with self._lock:
+                self._move_legacy_documents(session_id, self._open_store(session_id))
+        self.drop_legacy_collection_if_empty()
+        if self._get_legacy_collection() is None:
+            (self.vectorstore_path / LEGACY_MIGRATED_MARKER).touch()
+        return len(session_ids)
+
+    def needs_legacy_migration(self):
+        # a plain file check, so a migrated install starts without opening chroma
+        return self.vectorstore_path.exists() and not (self.vectorstore_path / LEGACY_MIGRATED_MARKER).exists()
+
+    def drop_legacy_collection_if_empty(self):
+        legacy = self._get_legacy_collection()
+        if legacy is not None and legacy.count() == 0:
+            self.client.delete_collection(LEGACY_COLLECTION_NAME)
+            return True
+        return False
+
+    def query(self, session_id, query, k=4, filter=None):
+        store = self._get_store(session_id, create=False)
+        if store is None:
+            return []
+        # repeated queries (node titles, /docs/query) are served from the embedding cache
+        embedding = self.embeddings.embed_query(query)
+        docs = store.similarity_search_by_vector(embedding, k=k, filter=filter)
+        return docs
+
+    async def aquery(self, session_id, query, k=4, filter=None):
+        # opening a collection reads chroma's sqlite, keep it off the event loop
+        store = await run_in_threadpool(self._get_store, session_id, False)
+        if store is None:
+            return []
+        embedding = await self.embeddings.aembed_query(query)
+        # chroma has no native async client here, langchain runs the search in an executor
+        docs = await store.asimilarity_search_by_vector(embedding, k=k, filter=filter)
         return docs
-    
-vectorstore_client = VectoreStoreClient()
\ No newline at end of file
+
+    def _collection_name(self, session_id):
+        return f"{SESSION_COLLECTION_PREFIX}{int(session_id)}"
+
+    def _get_store(self, session_id, create=True):
+        from chromadb.errors import NotFoundError
+        session_id = int(session_id)
+        store = self._stores.get(session_id)
+        if store is not None:
+            return store
+
+        if not create:
+            # reads of an empty session should not leave empty collections around
+            try:
+                self.client.get_collection(self._collection_name(session_id))
+            except NotFoundError:
+                return None
+
+        with self._lock:
+            store = self._stores.get(session_id)
+            if store is None:
+                store = self._open_store(session_id)
+            return store
+
+    def _open_store(self, session_id):
+        from langchain_chroma import Chroma
+        store = Chroma(client=self.client, collection_name=self._collection_name(session_id), embedding_function=self.embeddings)
+        self._stores.set(session_id, store)
+        return store
+
+    def _get_legacy_collection(self):
+        from chromadb.errors import NotFoundError
+        try:
+            return self.client.get_collection(LEGACY_COLLECTION_NAME)
+        except NotFoundError:
+            return None
+
+    def _move_legacy_documents(self, session_id, store):
+        legacy = self._get_legacy_collection()
+        if legacy is None:
+            return
+        # embeddings are copied as they are, nothing is sent to the embedding api again
+        while True:
+            page = legacy.get(where={"session_id": session_id}, limit=LEGACY_MOVE_BATCH_SIZE,
+                              include=["embeddings", "documents", "metadatas"])
+            if not page["ids"]:
+                return
+            store._collection.upsert(ids=page["ids"], embeddings=page["embeddings"],
+                                     documents=page["documents"], metadatas=page["metadatas"])
+            legacy.delete(ids=page["ids"])
+
+    def _delete_legacy_documents(self, session_id):
+        legacy = self._get_legacy_collection()
+        if legacy is not None:
+            legacy.delete(where={"session_id": session_id})
+
+vectorstore_client = VectoreStoreClient()
@@ -0,0 +1,88 @@
+import argparse
+import sqlite3
+
+GC_BATCH_SIZE = 1000
+CHROMA_SQLITE_FILE = "chroma.sqlite3"
+
+
+def find_orphaned_ids(vectorstore_client, session_id, live_sources, batch_size=GC_BATCH_SIZE):
+    orphaned = []
+    scanned = 0
+    for ids, metadatas in vectorstore_client.iter_document_metadata(session_id, batch_size):
+        scanned += len(ids)
+        for id_, metadata in zip(ids, metadatas):
+            source_id = (metadata or {}).get("source_id")
+            if source_id not in live_sources:
+                orphaned.append((id_, source_id))
+    return scanned, orphaned
+
+
+def collect_garbage(db_client, vectorstore_client, dry_run=False, batch_size=GC_BATCH_SIZE):
+    stats = {"collections": 0, "dropped": 0, "scanned": 0, "orphaned": 0, "deleted": 0}
+
+    # documents still in the old shared collection are moved out first, a dry run only counts their sessions
+    if not dry_run:
+        vectorstore_client.migrate_legacy_documents()
+    session_ids = set(vectorstore_client.list_session_ids()) | vectorstore_client.get_legacy_session_ids()
+    # a session row is written before its collection, so reading the live ids after listing keeps new sessions
+    live_sessions = db_client.get_session_ids()
+    live_sources = db_client.get_source_ids()
+    for session_id in sorted(session_ids):
+        stats["collections"] += 1
+        if session_id not in live_sessions:
+            stats["dropped"] += 1
+            if not dry_run:
+                vectorstore_client.delete_session_documents(session_id)
+            continue
+
+        scanned, candidates = find_orphaned_ids(vectorstore_client, session_id, live_sources, batch_size)
+        # a source row is written before its vectors, one inserted mid-scan shows up in a fresh read
+        if candidates:
+            live_sources = db_client.get_source_ids()
+        orphaned = [id_ for id_, source_id in candidates if source_id not in live_sources]
+        stats["scanned"] += scanned
+        stats["orphaned"] += len(orphaned)
+        if not dry_run:
+            # delete after the scan so offset paging is not shifted under us
+            for start in range(0, len(orphaned), batch_size):
+                vectorstore_client.delete_documents(session_id, orphaned[start:start + batch_size])
+            stats["deleted"] += len(orphaned)
+
+    return stats
+
+
+def vacuum(vectorstore_path):
+    # chroma only marks deleted rows free, VACUUM gives the pages back to the filesystem.
+    # it needs exclusive access, so only run this while the api is stopped
+    path = vectorstore_path / CHROMA_SQLITE_FILE
+    before = path.stat().st_size
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return before, path.stat().st_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete vectors whose source no longer exists and reclaim disk space")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    parser.add_argument("--no-vacuum", action="store_true", help="skip compacting the chroma sqlite file")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=".env")
+    from database.client import db_client
+    from vectorstore.client import vectorstore_client
+
+    stats = collect_garbage(db_client, vectorstore_client, dry_run=args.dry_run)
+    print(f"{stats['collections']} session collections, {stats['dropped']} dropped for deleted sessions")
+    print(f"scanned {stats['scanned']} vectors, {stats['orphaned']} orphaned, {stats['deleted']} deleted")
+
+    if not args.dry_run and not args.no_vacuum:
+        before, after = vacuum(vectorstore_client.vectorstore_path)
+        print(f"chroma sqlite {before // 1024}KB -> {after // 1024}KB")
+
+
+if __name__ == "__main__":
+    main()
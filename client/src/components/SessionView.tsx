@@ -572,7 +572,22 @@ export function SessionView() {
 
             {/* Tree Mindmap */}
             <div className="flex-1 min-h-0">
-                <TreeMindmap mindmap={session.mindmap} sessionId={sessionId} />
+                {session.mindmap ? (
+                    <TreeMindmap mindmap={session.mindmap} sessionId={sessionId} />
+                ) : (
+                    <div className="flex items-center justify-center h-full">
+                        <div className="text-center">
+                            {(session.status === 'pending' || session.status === 'running') ? (
+                                <>
+                                    <div className="animate-spin rounded-full h-8 w-8 border-b-2 border-blue-600 mx-auto mb-4"></div>
+                                    <p className="text-gray-600">Processing sources...</p>
+                                </>
+                            ) : (
+                                <p className="text-gray-600">Mindmap generation {session.status}</p>
+                            )}
+                        </div>
+                    </div>
+                )}
             </div>
         </div>
     )
@@ -36,6 +36,10 @@ export const useGetSession = (sessionId: string) => {
     queryFn: async (): Promise<FullSession> => {
       const data = await getSession(sessionId)
       return data
+    },
+    refetchInterval: (query) => {
+      const status = query.state.data?.status
+      return status === 'pending' || status === 'running' ? 2000 : false
     }
   })
 }
@@ -57,12 +57,15 @@ export type Chat = {
   messages: Message[]
 }
 
+export type SessionStatus = 'pending' | 'running' | 'completed' | 'failed' | 'cancelled'
+
 export type FullSession = {
   id: number
   title: string
   created_at: string
   sources: Source[]
-  mindmap: Mindmap
+  mindmap: Mindmap | null
+  status: SessionStatus
 }
 
 export type FileItem = {